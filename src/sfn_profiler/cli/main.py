@@ -12,30 +12,87 @@ Current limitations:
 """
 import argparse
 import os
+import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from functools import lru_cache
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from typing import Dict, List, Any, Tuple
 
+# numpy, pandas, plotly and jinja2 are imported by the functions that use them rather than here, so that `--help`
+# and argument errors return without loading them
 from sfn_profiler.clients.boto import session
 from sfn_profiler.clients.sfn import SfnClient
-from sfn_profiler.models import Event, AggregateEvent, Workflow
-from sfn_profiler.utils import get_hostname, file_arg_action, noop_context
-from sfn_profiler.utils.loops import find_loops_in_execution, coalesce_loop_events
+from sfn_profiler.models import Event, AggregateEvent, Loop, LoopIndex, Workflow
+from sfn_profiler.utils import as_filename, get_hostname, file_arg_action, noop_context
+from sfn_profiler.utils.loops import find_loops_in_execution
 from sfn_profiler.utils.sfn import get_execution_arn, process_execution_history
 
+# Tasks with more bars than this have runs of bars closer together than the timeline resolution merged
+MAX_BARS_PER_TASK = 500
+# Approximate number of distinguishable horizontal positions in the rendered timeline
+TIMELINE_RESOLUTION = 2000
+
+
+@lru_cache(maxsize=None)
+def templates():
+    """Get the template environment, created on first use."""
+    from jinja2 import Environment, FileSystemLoader
+
+    return Environment(
+        loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        keep_trailing_newline=True,
+    )
+
 
 def filter_small_steps(state_timing: List[Event], min_duration_sec):
-    return [e for e in state_timing if e.duration >= timedelta(seconds=min_duration_sec)]
+    min_duration = timedelta(seconds=min_duration_sec)
+    return [e for e in state_timing if e.duration >= min_duration]
+
+
+def coalesce_contributor_steps(events: List[Event], loops: List[Loop], min_duration_sec) -> List[Event]:
+    """
+    Coalesce the loops of a contributor workflow into single steps and drop steps shorter than the minimum
+    duration, in a single pass over its events.
+    """
+    min_duration = timedelta(seconds=min_duration_sec)
+    # The cheap duration check runs first so loop membership is only evaluated for steps that would be kept
+    index = LoopIndex.from_loops(loops)
+    steps = [e for e in events if e.duration >= min_duration and not index.contains_event(e.name, e.start)]
+    steps.extend(e for e in (loop.to_event() for loop in loops) if e.duration >= min_duration)
+    return steps
+
 
+def aggregate(contributor_data: List[Event]) -> Dict[str, AggregateEvent]:
+    """Aggregate the events of all contributors by step name, in order of first appearance."""
+    import pandas as pd
 
-def aggregate(aggregate_data: Dict[str, AggregateEvent], contributor_data: List[Event]):
-    """Aggregate data from contributors into aggregate."""
-    for event in contributor_data:
-        if event.name not in aggregate_data:
-            aggregate_data[event.name] = AggregateEvent.from_event(event)
-        aggregate_data[event.name].add_event(event)
-    return aggregate_data
+    if not contributor_data:
+        return {}
+    df = pd.DataFrame({
+        'name': [e.name for e in contributor_data],
+        'start': [e.start for e in contributor_data],
+        'end': [e.end for e in contributor_data],
+        'workflow': [e.workflow for e in contributor_data],
+    })
+    groups = df.groupby('name', sort=False)
+    bounds = groups.agg(start=('start', 'min'), end=('end', 'max'), contributors=('workflow', set))
+    # The per-step durations are gathered straight from the events, they are already computed and pandas would
+    # only have to convert them to its own timedeltas and back
+    rows = groups.indices
+    return {
+        name: AggregateEvent(
+            start=row.start.to_pydatetime(),
+            end=row.end.to_pydatetime(),
+            name=name,
+            values=[contributor_data[i].duration for i in rows[name]],
+            contributors=row.contributors,
+        )
+        for name, row in zip(bounds.index, bounds.itertuples(index=False))
+    }
 
 
 def fill_missing_steps(aggregated_events: Dict[str, AggregateEvent], contributors: List[Workflow]):
@@ -45,43 +102,126 @@ def fill_missing_steps(aggregated_events: Dict[str, AggregateEvent], contributor
                 aggregated_events[event.name].add_event(event)
 
 
+def aggregate_statistics_hover(values: List[float]) -> str:
+    """Build the hover text describing the distribution of an aggregate event's contributor durations."""
+    import numpy as np
+
+    durations = np.asarray(values, dtype=np.float64)
+
+    # Create histogram data for hover info
+    hist_data, bin_edges = np.histogram(durations, bins=min(10, durations.size))
+    bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
+
+    # Create ASCII histogram representation
+    max_bar_width = 20
+    max_count = hist_data.max()
+    bar_widths = hist_data * max_bar_width // max_count if max_count > 0 else np.zeros_like(hist_data)
+    ascii_hist = "<br>Duration distribution:<br>" + "".join(
+        f"{center:.1f}s: {'█' * width} ({count})<br>"
+        for center, width, count in zip(bin_centers.tolist(), bar_widths.tolist(), hist_data.tolist())
+    )
+
+    return (f"<br>Contributor workflow statistics:"
+            f"<br>Count: {durations.size}"
+            f"<br>Mean: {durations.mean():.2f}s"
+            f"<br>Median: {np.median(durations):.2f}s"
+            f"<br>Range: {durations.min():.2f}s - {durations.max():.2f}s"
+            f"<br>{ascii_hist}")
+
+
+def downsample_bars(task: str, origin, bases, durations, hovers, colors, resolution: float):
+    """
+    Collapse runs of a task's bars that sit closer together than `resolution` seconds into a single bar
+    spanning the run, since they could not be told apart on screen anyway. Each merged bar takes the color
+    of the longest bar in its run. Bars are expected to be ordered by start time.
+    """
+    import numpy as np
+    import pandas as pd
+
+    bar_ends = bases + durations
+    is_run_start = np.ones(bases.size, dtype=bool)
+    is_run_start[1:] = bases[1:] - np.maximum.accumulate(bar_ends)[:-1] > resolution
+    runs = np.flatnonzero(is_run_start)
+    run_sizes = np.diff(runs, append=bases.size)
+
+    run_bases = bases[runs]
+    run_durations = np.maximum.reduceat(bar_ends, runs) - run_bases
+    longest = np.lexsort((-durations, np.repeat(np.arange(runs.size), run_sizes)))[runs]
+
+    merged = run_sizes > 1
+    run_hovers = hovers[runs]
+    run_hovers[merged] = ("State: " + task
+                          + "<br>Start: " + (origin + pd.to_timedelta(run_bases[merged], unit='s')).strftime('%H:%M:%S')
+                          + "<br>End: " + (origin + pd.to_timedelta(run_bases[merged] + run_durations[merged], unit='s'))
+                          .strftime('%H:%M:%S')
+                          + "<br>Duration: " + pd.Series(run_durations[merged]).map('{:.2f}s'.format)
+                          + "<br>Merged steps: " + pd.Series(run_sizes[merged]).astype(str)
+                          + " (" + pd.Series(np.add.reduceat(durations, runs)[merged]).map('{:.2f}s'.format) + " total)"
+                          + "<br>").to_numpy(dtype=object)
+    return run_bases, run_durations, run_hovers, colors[longest]
+
+
 def create_timeline(workflow: Workflow, tmpdir: str) -> str:
     """Create a timeline using plotly.graph_objects and save it as an HTML file."""
+    import numpy as np
     import pandas as pd
-    import plotly.graph_objects as go
     import plotly.express as px
-    import numpy as np
+    import plotly.graph_objects as go
     from plotly.subplots import make_subplots
 
     hover_bg_color = "#f0eee6"
     hover_font_color = '#141413'
 
-    # Rest of the function remains the same
-    timeline_data = []
-
-    for event in workflow.events:
-        is_aggregate = isinstance(event, AggregateEvent)
-        timeline_data.append({
-            'Task': event.name,
-            'Start': event.start,
-            'Finish': event.end,
-            'Duration': event.total_seconds(),
-            'Attempts': event.attempts,
-            'IsContributor': event.workflow != workflow.id,
-            'IsAggregate': is_aggregate,
-            'EventDurations': event.durations() if is_aggregate else [],
-        })
-
-    df = pd.DataFrame(timeline_data)
-    workflow_df = df[df['IsContributor'] == False]
+    # Build the timeline column-wise from the workflow's columnar view of its events
+    events = workflow.events
+    columns = workflow.columns
+    count = len(events)
+    names = columns.names
+    # Displayed times keep the timezone of the events, so they are formatted from the original datetimes
+    starts = pd.DatetimeIndex([e.start for e in events])
+    ends = pd.DatetimeIndex([e.end for e in events])
+    durations = columns.durations
+    origin = workflow.start
+    bases = (starts - origin).total_seconds().to_numpy()
+    attempts = columns.attempts
+    is_contributor = ~workflow.own_events
+    is_aggregate = np.fromiter((isinstance(e, AggregateEvent) for e in events), dtype=bool, count=count)
+
+    hovers = ("State: " + pd.Series(names, dtype=object)
+              + "<br>Start: " + starts.strftime('%H:%M:%S')
+              + "<br>End: " + ends.strftime('%H:%M:%S')
+              + "<br>Duration: " + pd.Series(durations).map('{:.2f}s'.format)
+              + np.where(attempts > 1,
+                         "<br><b style='color:#550000'>Attempts: " + pd.Series(attempts).astype(str) + "</b>",
+                         "")
+              + "<br>").to_numpy(dtype=object)
+
+    # Add histogram info for contributor steps
+    for i in np.flatnonzero(is_aggregate):
+        values = events[i].durations()
+        if len(values) > 1:
+            hovers[i] += aggregate_statistics_hover(values)
 
     # Sort tasks by their first start time (reversed)
-    task_order = df.groupby('Task')['Start'].min().sort_values(ascending=True).index.tolist()
-    task_order.reverse()  # Reverse the order
-    df['Task'] = pd.Categorical(df['Task'], categories=task_order, ordered=True)
-    df = df.sort_values(by=['Start'])
+    codes, tasks = columns.name_codes, columns.unique_names
+    first_starts = np.full(len(tasks), np.inf)
+    np.minimum.at(first_starts, codes, bases)
+    task_codes = np.argsort(first_starts, kind='stable')[::-1]
+    task_order = [tasks[code] for code in task_codes]
+
+    # Group the rows of each task together, ordered by start time
+    rows = np.lexsort((bases, codes))
+    task_rows = np.split(rows, np.flatnonzero(np.diff(codes[rows])) + 1) if count else []
 
+    # Color workflow steps by their duration relative to the longest workflow step, sampling the scale once
     color_scale = px.colors.sequential.YlOrRd
+    colors = np.full(count, 'rgba(50, 50, 50, 0.3)', dtype=object)
+    is_workflow_step = ~is_contributor
+    if is_workflow_step.any():
+        step_durations = durations[is_workflow_step]
+        longest = step_durations.max()
+        scaled = np.clip(step_durations / longest, 0, 1) if longest > 0 else np.zeros(step_durations.size)
+        colors[is_workflow_step] = px.colors.sample_colorscale(color_scale, scaled.tolist())
 
     # Create figure with subplots for the main timeline and hidden histograms
     fig = make_subplots(
@@ -90,82 +230,43 @@ def create_timeline(workflow: Workflow, tmpdir: str) -> str:
         subplot_titles=["Execution Timeline"]
     )
 
-    # Add bars for each task
-    for task in task_order:
-        task_df = df[df['Task'] == task]
-
-        for idx, row in task_df.iterrows():
-            attempts = row['Attempts']
-            attempt_hover_piece = f"<br><b style='color:#550000'>Attempts: {attempts}</b>" if attempts > 1 else ""
-            hover_template = (f"State: {task}"
-                              f"<br>Start: {row['Start'].strftime('%H:%M:%S')}"
-                              f"<br>End: {row['Finish'].strftime('%H:%M:%S')}"
-                              f"<br>Duration: {row['Duration']:.2f}s"
-                              f"{attempt_hover_piece}"
-                              f"<br>")
-
-            # Add histogram info for contributor steps
-            if row['IsAggregate'] and len(row['EventDurations']) > 1:
-                values = row['EventDurations']
-
-                # Calculate statistics
-                mean_duration = np.mean(values)
-                median_duration = np.median(values)
-                min_duration = min(values)
-                max_duration = max(values)
-                vcount = len(values)
-
-                # Create histogram data for hover info
-                hist_data, bin_edges = np.histogram(values, bins=min(10, vcount))
-                bin_centers = 0.5 * (bin_edges[:-1] + bin_edges[1:])
-
-                # Create ASCII histogram representation
-                max_bar_width = 20
-                max_count = max(hist_data)
-                ascii_hist = "<br>Duration distribution:<br>"
-                for i, (center, count) in enumerate(zip(bin_centers, hist_data)):
-                    bar_width = int(count / max_count * max_bar_width) if max_count > 0 else 0
-                    bar = "█" * bar_width
-                    ascii_hist += f"{center:.1f}s: {bar} ({count})<br>"
-
-                hover_template += (f"<br>Contributor workflow statistics:"
-                                   f"<br>Count: {vcount}"
-                                   f"<br>Mean: {mean_duration:.2f}s"
-                                   f"<br>Median: {median_duration:.2f}s"
-                                   f"<br>Range: {min_duration:.2f}s - {max_duration:.2f}s"
-                                   f"<br>{ascii_hist}")
-
-            if row['IsContributor']:
-                color = 'rgba(50, 50, 50, 0.3)'
-            else:
-                color = px.colors.sample_colorscale(color_scale, task_df['Duration'] / workflow_df['Duration'].max())[0]
-
-            fig.add_trace(go.Bar(
-                x=[row['Duration']],
-                y=[row['Task']],
-                orientation='h',
-                name=task,
-                hovertemplate=hover_template + "<extra></extra>",
-                text='',
-                textposition='none',
-                marker=dict(
-                    color=color,
-                    line=dict(width=1, color='rgba(50,50,50,0.5)')
-                ),
-                base=[(row['Start'] - df['Start'].min()).total_seconds()],
-                showlegend=False,
-                hoverlabel=dict(bgcolor=hover_bg_color, font_color=hover_font_color)
-            ))
+    # Add a single bar trace for each task, downsampling tasks with more bars than can be usefully displayed
+    resolution = (bases + durations).max(initial=0) / TIMELINE_RESOLUTION
+    for task, code in zip(task_order, task_codes):
+        idx = task_rows[code]
+        task_bases, task_durations, task_hovers, task_colors = bases[idx], durations[idx], hovers[idx], colors[idx]
+        if idx.size > MAX_BARS_PER_TASK:
+            task_bases, task_durations, task_hovers, task_colors = downsample_bars(
+                task, origin, task_bases, task_durations, task_hovers, task_colors, resolution)
+
+        fig.add_trace(go.Bar(
+            x=task_durations,
+            y=np.full(task_durations.size, task, dtype=object),
+            orientation='h',
+            name=task,
+            hovertemplate=task_hovers + "<extra></extra>",
+            text='',
+            textposition='none',
+            marker=dict(
+                color=task_colors,
+                line=dict(width=1, color='rgba(50,50,50,0.5)')
+            ),
+            base=task_bases,
+            showlegend=False,
+            hoverlabel=dict(bgcolor=hover_bg_color, font_color=hover_font_color)
+        ))
 
     # Add translucent boxes for loops
+    task_positions = {task: position for position, task in enumerate(task_order)}
     for loop_num, loop in enumerate(workflow.loops, 1):
         if loop.iterations <= 1:
             continue
-        start = (loop.start - df['Start'].min()).total_seconds() - 10
-        end = (loop.end - df['Start'].min()).total_seconds() + 10
+        start = (loop.start - origin).total_seconds() - 10
+        end = (loop.end - origin).total_seconds() + 10
 
-        y_min = min(task_order.index(name) for name in loop.names) - 1
-        y_max = max(task_order.index(name) for name in loop.names) + 1
+        loop_positions = [task_positions[name] for name in loop.names]
+        y_min = min(loop_positions) - 1
+        y_max = max(loop_positions) + 1
 
         fig.add_shape(
             type="rect",
@@ -269,65 +370,24 @@ def parse_args():
     parser.add_argument("--out-dir", required=False, help="Directory to write the HTML files to")
     return parser.parse_args()
 
-# TODO: move this to a jinja template
-
 
 def write_profile(name: Any, execution_profiles: List[Tuple[Workflow, str]], tmp_dir: str):
-    full_path = os.path.join(tmp_dir, str(name).replace(":", "-").replace("/", "-") + '.html')
-    html = "<html>\n"
-    html += "<head>\n"
-    html += "<script>\n"
-    html += '''
-    function resizeIframe(iframeId) {
-      const iframe = document.getElementById(iframeId);
-      iframe.onload = function() {
-        const height = iframe.contentWindow.document.body.scrollHeight;
-        iframe.style.height = height + 'px';
-      };
-    };
-    '''
-    html += "window.addEventListener('DOMContentLoaded', function() {\n"
-    for i in range(len(execution_profiles)):
-        html += '  resizeIframe("iframe{num}");\n'.format(num=i)
-    html += "});\n"
-    html += "</script>\n"
-    html += "</head>\n"
-    html += "<body>\n"
-    for num, (workflow, file) in enumerate(execution_profiles):
-        relative_location = file.replace(tmp_dir, "")
-        html += f"<h3>{workflow.id}</h3>\n"
-        html += "<h4>Info</h4>\n"
-        html += "<ul>"
-        html += f"<li>Duration: {workflow.total_minutes():.2f} min ({workflow.total_seconds():.2f} sec)</li>\n"
-        html += f"<li>Start: {workflow.start.strftime('%Y-%m-%d %H:%M:%S %Z')}</li>\n"
-        html += f"<li>End: {workflow.end.strftime('%Y-%m-%d %H:%M:%S %Z')}</li>\n"
-        html += f"<li>Events: {len(workflow.events)}</li>\n"
-        html += "</ul>"
-        html += "<h4>Contributors</h4>\n"
-        html += "<div style='display: flex;'>\n"
-        html += "<div style='flex: 1'>\n"
-        html += "<b>Without Loops</b>\n"
-        html += "<table>\n"
-        html += "<tr><th>Task</th><th>Total Duration</th></tr>\n"
-        for task, duration in workflow.largest_contributors():
-            html += f"<tr><td>{task}</td><td>{duration:.2f}s</td></tr>\n"
-        html += "</table>\n"
-        html += "</div>\n"
-        html += "<div style='flex: 1'>\n"
-        html += "<b>Including Loops</b>\n"
-        html += "<table>\n"
-        html += "<tr><th>Task</th><th>Total Duration</th></tr>\n"
-        for task, duration in workflow.largest_contributors(with_loops=True):
-            html += f"<tr><td>{task}</td><td>{duration:.2f}s</td></tr>\n"
-        html += "</table>\n"
-        html += "</div>\n"
-        html += "</div>\n"
-        html += "<h4>Timeline</h4>\n"
-        html += f"<iframe id=\"iframe{num}\" src=\"{relative_location}\" width=\"100%\"></iframe>\n"
-    html += "</body>\n"
-    html += "</html>\n"
+    full_path = os.path.join(tmp_dir, as_filename(name) + '.html')
+    profiles = [
+        {
+            'id': workflow.id,
+            'total_seconds': workflow.total_seconds(),
+            'start': workflow.start,
+            'end': workflow.end,
+            'events': len(workflow.events),
+            'contributors_without_loops': workflow.largest_contributors(),
+            'contributors_with_loops': workflow.largest_contributors(with_loops=True),
+            'iframe_path': file.replace(tmp_dir, ""),
+        }
+        for workflow, file in execution_profiles
+    ]
     with open(full_path, "w") as f:
-        f.write(html)
+        templates().get_template('profile.html.j2').stream(profiles=profiles).dump(f)
     return full_path
 
 
@@ -370,34 +430,39 @@ def main():
     loops = find_loops_in_execution(events)
 
     workflows = [Workflow(id=execution_arn, events=events, loops=loops)]
-    aggregated_contributor_events: Dict[str, AggregateEvent] = {}
+    contributors_events: List[Event] = []
 
-    for contributor in contributors or []:
-        print(f"Profiling contributor {contributor}")
-        contributor_execution_arn = get_execution_arn(contributor)
-        _, contributor_history = sfn_client.get_state_machine_info(contributor_execution_arn)
+    # Contributor histories are fetched concurrently since each one is bound by Step Functions API round trips
+    contributor_execution_arns = [get_execution_arn(contributor) for contributor in contributors or []]
+    with ThreadPoolExecutor(max_workers=min(16, len(contributor_execution_arns) or 1)) as executor:
+        contributor_infos = list(executor.map(sfn_client.get_state_machine_info, contributor_execution_arns))
+
+    for contributor_execution_arn, (_, contributor_history) in zip(contributor_execution_arns, contributor_infos):
+        print(f"Profiling contributor {contributor_execution_arn}")
         contributor_events = process_execution_history(
             contributor_execution_arn,
             contributor_history,
             separate_retries=args.separate_retries)
         contributor_loops = find_loops_in_execution(contributor_events)
         if aggregate_contributors:
-            contributor_events = coalesce_loop_events(contributor_events, contributor_loops)
-        contributor_events = filter_small_steps(contributor_events, args.min_contributor_task_duration)
-        if aggregate_contributors:
-            aggregated_contributor_events = aggregate(aggregated_contributor_events, contributor_events)
+            contributors_events.extend(coalesce_contributor_steps(
+                contributor_events, contributor_loops, args.min_contributor_task_duration))
         else:
+            contributor_events = filter_small_steps(contributor_events, args.min_contributor_task_duration)
             workflows.append(Workflow(id=contributor_execution_arn, events=contributor_events, loops=contributor_loops))
 
     if aggregate_contributors:
+        aggregated_contributor_events = aggregate(contributors_events)
         fill_missing_steps(aggregated_contributor_events, workflows[1:])
         workflows = [workflows[0]] + [Workflow(id='AGG CONTR', events=list(aggregated_contributor_events.values()), loops=[])]
 
     if interleave_contributors:
         # merge everything into the first state timings
         for workflow in workflows[1:]:
+            # Interned like the original step names, they are grouped by name in the merged workflow
+            prefix = f"[{workflow.id}] "
             for event in workflow.events:
-                event.name = f"[{workflow.id}] {event.name}"
+                event.name = sys.intern(prefix + event.name)
             workflows[0].add_events(workflow.events)
         workflows = [workflows[0]]
 
@@ -5,7 +5,7 @@ A script for turning a AWS Step Function execution into a json file consumable b
 
 import argparse
 import random
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
 
 from sfn_profiler.clients.boto import session
 from sfn_profiler.clients.sfn import SfnClient
@@ -16,13 +16,32 @@ from sfn_profiler.models.perfetto.perfetto_trace_pb2 import (
     TrackDescriptor,
     TrackEvent,
     ThreadDescriptor,
-    Trace
 )
 from sfn_profiler.utils import file_arg_action
 from sfn_profiler.utils.sfn import process_execution_history
 
 
+SLICE_BEGIN = TrackEvent.TYPE_SLICE_BEGIN
+SLICE_END = TrackEvent.TYPE_SLICE_END
+
+
+def slice_packet(timestamp: int, slice_type: int, track_uuid: int, name: str, sequence_id: int) -> TracePacket:
+    """
+    Create a slice begin/end packet. The nested track event is filled in place rather than built as a
+    separate message and copied into the packet.
+    """
+    packet = TracePacket(timestamp=timestamp, trusted_packet_sequence_id=sequence_id)
+    track_event = packet.track_event
+    track_event.type = slice_type
+    track_event.track_uuid = track_uuid
+    track_event.name = name
+    return packet
+
+
 def generate_trace_packets(num: int, execution: ExecutionArn, events: List[Event]) -> List[TracePacket]:
+    import numpy as np
+    import pandas as pd
+
     process_uuid = num
     trusted_packet_sequence_id = random.randint(10**6, 10**7)
     task_ids: Dict[str, int] = {}
@@ -38,12 +57,13 @@ def generate_trace_packets(num: int, execution: ExecutionArn, events: List[Event
         ),
     ))
 
-    start = events[0].start
-
-    for event in events:
-        rel_start = int((event.start - start).total_seconds() * 1e9)
-        rel_end = int((event.end - start).total_seconds() * 1e9)
+    # Offsets (in nanoseconds) of every event relative to the first one, computed in one vectorized pass
+    starts = pd.DatetimeIndex([event.start for event in events])
+    ends = pd.DatetimeIndex([event.end for event in events])
+    rel_starts = (starts - starts[0]).to_numpy(dtype='timedelta64[ns]').astype(np.int64).tolist()
+    rel_ends = (ends - starts[0]).to_numpy(dtype='timedelta64[ns]').astype(np.int64).tolist()
 
+    for event, rel_start, rel_end in zip(events, rel_starts, rel_ends):
         if event.name not in task_ids:
             task_ids[event.name] = len(task_ids) + 1 + num
             packets.append(TracePacket(
@@ -57,30 +77,37 @@ def generate_trace_packets(num: int, execution: ExecutionArn, events: List[Event
                 ),
             ))
 
-        packets.append(TracePacket(
-            timestamp=rel_start,
-            track_event=TrackEvent(
-                type=TrackEvent.TYPE_SLICE_BEGIN,
-                track_uuid=task_ids[event.name],
-                name=event.name,
-            ),
-            trusted_packet_sequence_id=trusted_packet_sequence_id,
-        ))
-        packets.append(TracePacket(
-            timestamp=rel_end,
-            track_event=TrackEvent(
-                type=TrackEvent.TYPE_SLICE_END,
-                track_uuid=task_ids[event.name],
-                name=event.name,
-            ),
-            trusted_packet_sequence_id=trusted_packet_sequence_id,
+        track_uuid = task_ids[event.name]
+        packets.extend((
+            slice_packet(rel_start, SLICE_BEGIN, track_uuid, event.name, trusted_packet_sequence_id),
+            slice_packet(rel_end, SLICE_END, track_uuid, event.name, trusted_packet_sequence_id),
         ))
     return packets
 
 
-def write_trace(packets: List[TracePacket], output_file: str):
+# Wire tag of the repeated `packet` field (field number 1, length-delimited) of the Trace message
+TRACE_PACKET_TAG = b"\x0a"
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as a protobuf base 128 varint."""
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def write_trace(packets: Iterable[TracePacket], output_file: str):
+    """
+    Write the packets as a serialized Trace message. Each packet is encoded as one element of the repeated
+    `packet` field and streamed to the file on its own, so the whole trace is never held in memory at once.
+    """
     with open(output_file, "wb") as f:
-        f.write(Trace(packet=packets).SerializeToString())
+        for packet in packets:
+            data = packet.SerializeToString()
+            f.write(TRACE_PACKET_TAG + encode_varint(len(data)) + data)
 
 
 def parse_args():
@@ -93,18 +120,26 @@ def parse_args():
     return parser.parse_args()
 
 
-def main():
-    args = parse_args()
-    sfn_client = SfnClient(session())
-
-    packets = []
-    for num, execution in enumerate(args.executions):
+def execution_trace_packets(sfn_client: SfnClient, executions: List[str]) -> Iterator[TracePacket]:
+    """
+    Generate the trace packets of each execution in turn, so only the packets of one execution are held at a time.
+    """
+    # Track ids are offset by the number of packets generated so far, which keeps them unique across executions
+    packet_count = 0
+    for num, execution in enumerate(executions):
         arn = ExecutionArn.parse(execution)
         _, execution_history = sfn_client.get_state_machine_info(arn)
         events = process_execution_history(arn, execution_history)
-        packets.extend(generate_trace_packets(num + len(packets), arn, events))
+        packets = generate_trace_packets(num + packet_count, arn, events)
+        packet_count += len(packets)
+        yield from packets
+
+
+def main():
+    args = parse_args()
+    sfn_client = SfnClient(session())
 
-    write_trace(packets, args.output)
+    write_trace(execution_trace_packets(sfn_client, args.executions), args.output)
     print(f"Generated Perfetto proto file: {args.output}")
     print("To view the trace, visit https://ui.perfetto.dev/ and load this file.")
 
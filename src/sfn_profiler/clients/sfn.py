@@ -3,6 +3,9 @@ from typing import Dict, List, Tuple
 from sfn_profiler.models import ExecutionArn
 from sfn_profiler.utils.cache import filecache
 
+# Largest page size allowed by GetExecutionHistory, minimizing round trips for long histories
+HISTORY_PAGE_SIZE = 1000
+
 
 class SfnClient:
 
@@ -21,14 +24,11 @@ class SfnClient:
     @filecache
     def get_state_machine_info(self, execution_arn: ExecutionArn) -> Tuple[Dict, List[Dict]]:
         """Get state machine execution history and definition."""
-        history = []
-        params = dict(executionArn=str(execution_arn))
-        while True:
-            response = self.client.get_execution_history(**params)
-            history.extend(response['events'])
-            if 'nextToken' not in response:
-                break
-            params['nextToken'] = response['nextToken']
+        pages = self.client.get_paginator('get_execution_history').paginate(
+            executionArn=str(execution_arn),
+            PaginationConfig={'PageSize': HISTORY_PAGE_SIZE},
+        )
+        history = [event for page in pages for event in page['events']]
 
         execution_details = self.client.describe_execution(executionArn=str(execution_arn))
         return execution_details, history
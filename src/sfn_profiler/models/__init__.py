@@ -1,47 +1,123 @@
-from collections import Counter, defaultdict
-from dataclasses import dataclass
+import heapq
+import sys
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta
-from functools import cached_property
-from typing import List, Set, Any, Union
+from functools import lru_cache
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional, Set, Any, Tuple, Union
 
+from sfn_profiler.utils import as_filename
 
-@dataclass
+if TYPE_CHECKING:
+    # numpy and pandas are imported where they are used, so that importing the models (e.g. for a CLI's --help)
+    # does not load them
+    import numpy as np
+
+
+def to_microseconds(times: List[datetime]) -> 'np.ndarray':
+    """Convert datetimes to integer microseconds since the epoch (in UTC for timezone aware datetimes)."""
+    import numpy as np
+    import pandas as pd
+
+    # pandas converts the whole list to UTC at once, naive datetimes are taken as UTC already
+    return pd.to_datetime(times, utc=True).to_numpy('datetime64[us]').view(np.int64)
+
+
+def slotted(cls):
+    """
+    Recreate a dataclass with __slots__ for its fields, like dataclass(slots=True) does on Python 3.10+,
+    so instances carry no per-instance __dict__ and attribute access goes straight to the slot.
+    """
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(f.name for f in fields(cls))
+    for name in field_names:
+        cls_dict.pop(name, None)
+    cls_dict.pop('__dict__', None)
+    cls_dict.pop('__weakref__', None)
+    cls_dict['__slots__'] = field_names
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
+@dataclass(frozen=True)
 class ExecutionArn:
+    # _str holds the formatted ARN, it is not a field so it takes no part in equality or hashing
+    __slots__ = ('account', 'region', 'state_machine', 'execution', '_str')
+
     account: str
     region: str
     state_machine: str
     execution: str
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def parse(arn: str):
-        parts = arn.split(':')
-        if len(parts) != 8:
+        # Counting separators rejects malformed input without allocating the parts
+        if arn.count(':') != 7:
             raise ValueError(f"Invalid ARN: {arn}")
-        return ExecutionArn(account=parts[4], region=parts[3], state_machine=parts[6], execution=parts[7])
+        _, _, _, region, account, _, state_machine, execution = arn.split(':')
+        return ExecutionArn(account, region, state_machine, execution)
+
+    def __post_init__(self):
+        arn = f"arn:aws:states:{self.region}:{self.account}:execution:{self.state_machine}:{self.execution}"
+        object.__setattr__(self, '_str', sys.intern(arn))
 
     def __str__(self):
-        return f"arn:aws:states:{self.region}:{self.account}:execution:{self.state_machine}:{self.execution}"
+        return self._str
 
-    def __hash__(self):
-        return hash(str(self))
+    def __reduce__(self):
+        # Frozen slotted instances cannot have their state restored attribute by attribute, so rebuild them instead
+        return ExecutionArn, (self.account, self.region, self.state_machine, self.execution)
 
 
-@dataclass
+@slotted
+@dataclass(init=False)
 class Event:
     start: datetime
     end: datetime
     name: str
     workflow: ExecutionArn
     attempts: int = 1
+    # Computed whenever the event is created or moved, see _move_event
+    _duration: timedelta = field(init=False, repr=False, compare=False)
+    _total_seconds: float = field(init=False, repr=False, compare=False)
+
+    def __init__(self, start: datetime, end: datetime, name: str, workflow: ExecutionArn, attempts: int = 1):
+        _move_event(self, start, end)
+        self.name = name
+        self.workflow = workflow
+        self.attempts = attempts
+
+    def __reduce__(self):
+        # The times can only be restored together, so events are pickled through their constructor
+        return Event, (self.start, self.end, self.name, self.workflow, self.attempts)
 
     @property
     def duration(self) -> timedelta:
-        return self.end - self.start
+        return self._duration
 
     def total_seconds(self):
-        return self.duration.total_seconds()
+        return self._total_seconds
+
+
+# Slot descriptors of the event times. Event exposes them through properties that set both times through
+# _move_event, so the cached duration always matches the times
+_EVENT_START, _EVENT_END = Event.start, Event.end
+
+
+def _move_event(event: Event, start: datetime, end: datetime):
+    _EVENT_START.__set__(event, start)
+    _EVENT_END.__set__(event, end)
+    event._duration = end - start
+    event._total_seconds = event._duration.total_seconds()
+
 
+Event.start = property(_EVENT_START.__get__, lambda event, start: _move_event(event, start, event.end))
+Event.end = property(_EVENT_END.__get__, lambda event, end: _move_event(event, event.start, end))
 
+
+@slotted
 @dataclass
 class AggregateEvent:
     start: datetime
@@ -50,6 +126,11 @@ class AggregateEvent:
     values: List[timedelta]
     contributors: Set[ExecutionArn]
     attempts: int = 1
+    # Computed on first use and reset whenever an added event widens the span
+    _duration: Optional[timedelta] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._duration = None
 
     @property
     def workflow(self):
@@ -57,7 +138,9 @@ class AggregateEvent:
 
     @property
     def duration(self) -> timedelta:
-        return self.end - self.start
+        if self._duration is None:
+            self._duration = self.end - self.start
+        return self._duration
 
     def total_seconds(self):
         return self.duration.total_seconds()
@@ -68,8 +151,10 @@ class AggregateEvent:
     def add_event(self, event: Event):
         self.values.append(event.duration)
         self.contributors.add(event.workflow)
-        self.start = min(self.start, event.start)
-        self.end = max(self.end, event.end)
+        if event.start < self.start or event.end > self.end:
+            self.start = min(self.start, event.start)
+            self.end = max(self.end, event.end)
+            self._duration = None
 
     @staticmethod
     def from_event(event):
@@ -82,6 +167,13 @@ class AggregateEvent:
         )
 
 
+@lru_cache(maxsize=4096)
+def _loop_name(names: FrozenSet[str]) -> str:
+    """Get the name of a loop over the given steps, shared by every loop over the same steps."""
+    return sys.intern('|'.join(sorted(names)))
+
+
+@slotted
 @dataclass
 class Loop:
     name: str
@@ -89,19 +181,32 @@ class Loop:
     end: datetime
     iterations: int
     events: List[Event]
-    names: Set[str]
+    names: FrozenSet[str]
+    simple_name: str = field(init=False, repr=False, compare=False)
+    _duration: timedelta = field(init=False, repr=False, compare=False)
+    _total_seconds: float = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Sorted and interned like step names, coalesced loops become steps that are grouped by this name
+        # across contributors, so it must not depend on set iteration order
+        self.simple_name = _loop_name(frozenset(self.names))
+        self._duration = self.end - self.start
+        self._total_seconds = self._duration.total_seconds()
 
     @staticmethod
     def from_stack(stack: List[Event]):
         """Create a loop from a stack of state machine events."""
-        name = '|'.join(sorted(e.name for e in stack))
-        iterations = Counter(e.name for e in stack).most_common(1)[0][1]
-        names = set([e.name for e in stack])
+        start, end = stack[0].start, stack[-1].end
+        # Count the steps in a single pass, everything else is derived from the (much smaller) unique names
+        counts: Dict[str, int] = {}
+        for e in stack:
+            counts[e.name] = counts.get(e.name, 0) + 1
+        names = frozenset(counts)
         return Loop(
-            name=name,
-            start=stack[0].start,
-            end=stack[-1].end,
-            iterations=iterations,
+            name=_loop_name(names),
+            start=start,
+            end=end,
+            iterations=max(counts.values()),
             events=stack,
             names=names,
         )
@@ -109,20 +214,15 @@ class Loop:
     @property
     def duration(self) -> timedelta:
         """Get the duration of the loop."""
-        return self.end - self.start
-
-    @cached_property
-    def simple_name(self) -> str:
-        """Get the simple name of the loop."""
-        return '|'.join(self.names)
+        return self._duration
 
     def total_seconds(self) -> float:
-        return self.duration.total_seconds()
+        return self._total_seconds
 
     def __contains__(self, item):
-        if isinstance(item, (Event, AggregateEvent)):
-            return item.name in self.names and self.start <= item.start <= self.end
-        raise ValueError(f'Invalid item type: {type(item)}')
+        if not isinstance(item, (Event, AggregateEvent)):
+            raise ValueError(f'Invalid item type: {type(item)}')
+        return item.name in self.names and self.start <= item.start <= self.end
 
     def to_event(self) -> Event:
         """Convert the loop to an event."""
@@ -130,18 +230,102 @@ class Loop:
         return Event(start=self.start, end=self.end, name=self.simple_name, workflow=workflow)
 
 
+@dataclass
+class LoopIndex:
+    """Time spans of loops indexed by step name, with overlapping spans merged, for fast membership checks."""
+    spans: Dict[str, Tuple[List[datetime], List[datetime]]]
+    _microsecond_spans: 'Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]]' = field(
+        default=None, init=False, repr=False, compare=False)
+
+    @staticmethod
+    def from_loops(loops: List[Loop]):
+        intervals = defaultdict(list)
+        for loop in loops:
+            for name in loop.names:
+                intervals[name].append((loop.start, loop.end))
+        spans = {}
+        for name, name_intervals in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(name_intervals):
+                if ends and start <= ends[-1]:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            spans[name] = (starts, ends)
+        return LoopIndex(spans=spans)
+
+    def contains_event(self, name: str, start: datetime) -> bool:
+        """Check whether a step with the given name and start time is part of any of the loops."""
+        span = self.spans.get(name)
+        if span is None:
+            return False
+        starts, ends = span
+        i = bisect_right(starts, start) - 1
+        return i >= 0 and start <= ends[i]
+
+    def microsecond_spans(self) -> 'Dict[str, Tuple[np.ndarray, np.ndarray]]':
+        """Get the spans as integer microseconds since the epoch, for use with EventColumns, converted once."""
+        if self._microsecond_spans is None:
+            self._microsecond_spans = {
+                name: (to_microseconds(starts), to_microseconds(ends)) for name, (starts, ends) in self.spans.items()
+            }
+        return self._microsecond_spans
+
+
+@dataclass
+class EventColumns:
+    """Columnar (structure of arrays) view of a list of events, with times as integer microseconds."""
+    names: 'np.ndarray'
+    name_codes: 'np.ndarray'
+    unique_names: List[str]
+    workflows: 'np.ndarray'
+    starts: 'np.ndarray'
+    ends: 'np.ndarray'
+    attempts: 'np.ndarray'
+
+    @staticmethod
+    def from_events(events: List[Union[Event, AggregateEvent]]):
+        import numpy as np
+
+        count = len(events)
+        codes: Dict[str, int] = {}
+        names = np.fromiter((e.name for e in events), dtype=object, count=count)
+        return EventColumns(
+            names=names,
+            name_codes=np.fromiter((codes.setdefault(name, len(codes)) for name in names), dtype=np.intp, count=count),
+            unique_names=list(codes),
+            workflows=np.fromiter((e.workflow for e in events), dtype=object, count=count),
+            starts=to_microseconds([e.start for e in events]),
+            ends=to_microseconds([e.end for e in events]),
+            attempts=np.fromiter((e.attempts for e in events), dtype=np.int64, count=count),
+        )
+
+    @property
+    def durations(self) -> 'np.ndarray':
+        """Get the duration of each event in seconds."""
+        return (self.ends - self.starts) / 1e6
+
+
+@slotted
 @dataclass
 class Workflow:
     id: Any
     events: List[Union[Event, AggregateEvent]]
     loops: List[Loop]
-    _start: datetime = None
-    _end: datetime = None
+    _start: Optional[datetime] = None
+    _end: Optional[datetime] = None
+    _columns: Optional[EventColumns] = field(init=False, repr=False, compare=False)
+    _own_events: 'Optional[np.ndarray]' = field(init=False, repr=False, compare=False)
+    _loop_index: Optional[LoopIndex] = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
+        self._columns = None
+        self._own_events = None
+        self._loop_index = None
         if self.events:
-            self._start = min(e.start for e in self.events or [])
-            self._end = max(e.end for e in self.events or [])
+            self._start, self._end = None, None
+            self._extend_bounds(self.events)
 
     def __hash__(self):
         return hash(self.id)
@@ -150,19 +334,59 @@ class Workflow:
         if not events:
             return
         self.events.extend(events)
-        mn, mx = min(events, key=lambda e: e.start), max(events, key=lambda e: e.end)
-        self._start = min(self._start, mn.start) if self._start else mn.start
-        self._end = max(self._end, mx.end) if self._end else mx.end
+        self._columns = None
+        self._own_events = None
+        self._extend_bounds(events)
+
+    def _extend_bounds(self, events: List[Union[Event, AggregateEvent]]):
+        """Widen the tracked start and end to cover the given events, in a single pass over them."""
+        start, end = self._start, self._end
+        for event in events:
+            if start is None or event.start < start:
+                start = event.start
+            if end is None or event.end > end:
+                end = event.end
+        self._start, self._end = start, end
+
+    @property
+    def columns(self) -> EventColumns:
+        """Get a columnar view of the events, built on first use and kept until events are added."""
+        if self._columns is None:
+            self._columns = EventColumns.from_events(self.events)
+        return self._columns
+
+    @property
+    def loop_index(self) -> LoopIndex:
+        """Get the index of the loop spans by step name, built on first use."""
+        if self._loop_index is None:
+            self._loop_index = LoopIndex.from_loops(self.loops)
+        return self._loop_index
+
+    def event_in_any_loop(self, event: Union[Event, AggregateEvent]) -> bool:
+        """Check whether an event is part of any of the workflow's loops."""
+        return self.loop_index.contains_event(event.name, event.start)
+
+    @property
+    def own_events(self) -> 'np.ndarray':
+        """Get a mask of the events of this workflow itself (rather than of its contributors), kept with the columns."""
+        if self._own_events is None:
+            import numpy as np
+
+            workflows = self.columns.workflows
+            # Events of one execution usually share a single ARN object, so most rows match on identity alone
+            self._own_events = np.fromiter(
+                (w is self.id or w == self.id for w in workflows), dtype=bool, count=workflows.size)
+        return self._own_events
 
     def id_as_filename(self):
-        return str(self.id).replace(":", "-").replace("/", "-")
+        return as_filename(self.id)
 
     @property
-    def start(self) -> datetime:
+    def start(self) -> Optional[datetime]:
         return self._start
 
     @property
-    def end(self) -> datetime:
+    def end(self) -> Optional[datetime]:
         return self._end
 
     @property
@@ -175,19 +399,46 @@ class Workflow:
         return self.total_seconds() / 60
 
     def total_seconds(self) -> float:
-        return self.duration.total_seconds()
+        if self._start is None or self._end is None:
+            return 0.0
+        return (self._end - self._start).total_seconds()
 
     def largest_contributors(self, n=10, with_loops=False):
-        return self._largest_contributors(with_loops)[:n]
+        if n == 0:
+            return []
+        if n < 0:
+            return self._largest_contributors(with_loops)[:n]
+        # Select the top n with a partial heap sort instead of sorting every step
+        return heapq.nlargest(n, self._contributor_durations(with_loops).items(), key=itemgetter(1))
 
     def _largest_contributors(self, with_loops=False):
-        durations = defaultdict(float)
-        for event in self.events:
-            if event.workflow != self.id:
-                continue
-            if not with_loops or all(event not in loop for loop in self.loops):
-                durations[event.name] += event.total_seconds()
-        if with_loops and self.loops:
+        durations = self._contributor_durations(with_loops)
+        return list(sorted(durations.items(), key=itemgetter(1), reverse=True))
+
+    def _contributor_durations(self, with_loops=False) -> Dict[str, float]:
+        import numpy as np
+
+        columns = self.columns
+        included = self.own_events.copy()
+        if with_loops:
+            unique_names = {name: code for code, name in enumerate(columns.unique_names)}
+            for name, (span_starts, span_ends) in self.loop_index.microsecond_spans().items():
+                if name not in unique_names:
+                    continue
+                candidates = np.flatnonzero(included & (columns.name_codes == unique_names[name]))
+                event_starts = columns.starts[candidates]
+                span = np.searchsorted(span_starts, event_starts, side='right') - 1
+                in_loop = (span >= 0) & (event_starts <= span_ends[np.maximum(span, 0)])
+                included[candidates[in_loop]] = False
+
+        # Sum durations per step name with a single bincount, keeping names in order of first appearance
+        rows = np.flatnonzero(included)
+        codes = columns.name_codes[rows]
+        totals = np.bincount(codes, weights=columns.durations[rows], minlength=len(columns.unique_names))
+        present, first_rows = np.unique(codes, return_index=True)
+        durations = {columns.unique_names[code]: totals[code].item() for code in present[np.argsort(first_rows)].tolist()}
+        if with_loops:
             for loop in self.loops:
-                durations[f"[LOOP] {loop.simple_name}"] += loop.total_seconds()
-        return list(sorted(durations.items(), key=lambda x: x[1], reverse=True))
+                loop_name = f"[LOOP] {loop.simple_name}"
+                durations[loop_name] = durations.get(loop_name, 0.0) + loop.total_seconds()
+        return durations
@@ -1,4 +1,5 @@
 import argparse
+from contextlib import nullcontext
 from typing import Optional, Any
 
 
@@ -7,6 +8,10 @@ def get_hostname():
     return socket.gethostname()
 
 
+def as_filename(value: Any) -> str:
+    return str(value).replace(":", "-").replace("/", "-")
+
+
 def file_arg_action(*args, **kwargs):
     class FlattenAction(argparse.Action):
         def __call__(self, parser, namespace, values, option_string=None):
@@ -15,7 +20,7 @@ def file_arg_action(*args, **kwargs):
             for value in values:
                 if value and isinstance(value, str) and value.startswith("file://"):
                     with open(value[len("file://"):]) as f:
-                        result.extend([line.rstrip() for line in f.readlines()])
+                        result.extend(line.rstrip() for line in f)
                 else:
                     result.append(value)
             # Set the attribute to our flattened list
@@ -26,14 +31,4 @@ def file_arg_action(*args, **kwargs):
 def noop_context(c: Optional[Any]) -> Optional[Any]:
     if not c:
         return None
-
-    class NoopContext:
-        def __init__(self, c):
-            self.c = c
-
-        def __enter__(self):
-            return c
-
-        def __exit__(self, exc_type, exc_val, exc_tb):
-            pass
-    return NoopContext(c)
+    return nullcontext(c)
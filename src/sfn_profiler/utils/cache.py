@@ -1,7 +1,11 @@
+import gc
 import hashlib
+import io
 import os
 import pickle
+import threading
 import time
+from contextlib import contextmanager
 from typing import Any, Optional
 
 from appdirs import user_cache_dir
@@ -10,25 +14,105 @@ DEFAULT_CACHE_EXPIRY = 31 * 24 * 3600
 
 _CACHE_DIR = os.getenv("SDT_CACHE_DIR", user_cache_dir("sfn-profiler"))
 
+# Lists inside cached tuples (e.g. execution histories) are pickled in independent chunks of this many items,
+# which keeps the pickler's memo small instead of tracking every object of the whole list at once
+CHUNK_SIZE = 1000
+_CHUNKED_FORMAT = "sfn-profiler-chunked-v1"
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+def _dump(data: Any, f):
+    # One pickler streams every frame, its memo is cleared after each frame so the frames stay independent
+    pickler = pickle.Pickler(f, protocol=PICKLE_PROTOCOL)
+
+    def dump(obj):
+        pickler.dump(obj)
+        pickler.clear_memo()
+
+    if not isinstance(data, tuple):
+        dump(data)
+        return
+    dump((_CHUNKED_FORMAT, len(data)))
+    for item in data:
+        if isinstance(item, list):
+            dump((list, len(item)))
+            for i in range(0, len(item), CHUNK_SIZE):
+                dump(item[i:i + CHUNK_SIZE])
+        else:
+            dump((None, item))
+
+
+def _load(f) -> Any:
+    header = pickle.load(f)
+    if not (isinstance(header, tuple) and len(header) == 2 and header[0] == _CHUNKED_FORMAT):
+        return header
+    items = []
+    for _ in range(header[1]):
+        kind, value = pickle.load(f)
+        if kind is list:
+            chunks = []
+            while len(chunks) < value:
+                chunks.extend(pickle.load(f))
+            items.append(chunks)
+        else:
+            items.append(value)
+    return tuple(items)
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector. Unpickling a large history allocates many containers that would otherwise
+    trigger repeated, fruitless collections of everything loaded so far.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
 
 def store(key: str, data: Any):
-    if not os.path.exists(_CACHE_DIR):
-        os.makedirs(_CACHE_DIR)
-    with open(os.path.join(_CACHE_DIR, f"{key}.pkl"), "wb") as f:
-        pickle.dump(data, f)
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    # Write to a thread/process unique file and atomically swap it in so concurrent callers
+    # never observe (or load) a partially written entry
+    path = os.path.join(_CACHE_DIR, f"{key}.pkl")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            _dump(data, f)
+        os.replace(tmp_path, path)
+    finally:
+        # Only left behind if the dump or the swap failed
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
-def load(key: str, expiry=DEFAULT_CACHE_EXPIRY) -> Optional[bytes]:
-    if exists(key, expiry):
+def _read(key: str, expiry=DEFAULT_CACHE_EXPIRY):
+    try:
         with open(os.path.join(_CACHE_DIR, f"{key}.pkl"), "rb") as f:
-            return pickle.load(f)
-    return None
+            if time.time() - os.fstat(f.fileno()).st_mtime >= expiry:
+                return False, None
+            # The entry is read whole and unpickled from memory
+            data = f.read()
+        with _gc_paused():
+            return True, _load(io.BytesIO(data))
+    except FileNotFoundError:
+        return False, None
+
+
+def load(key: str, expiry=DEFAULT_CACHE_EXPIRY) -> Optional[bytes]:
+    return _read(key, expiry)[1]
 
 
 def exists(key: str, expiry=DEFAULT_CACHE_EXPIRY) -> bool:
-    if not os.path.exists(os.path.join(_CACHE_DIR, f"{key}.pkl")):
+    try:
+        st = os.stat(os.path.join(_CACHE_DIR, f"{key}.pkl"))
+    except FileNotFoundError:
         return False
-    return time.time() - os.path.getmtime(os.path.join(_CACHE_DIR, f"{key}.pkl")) < expiry
+    return time.time() - st.st_mtime < expiry
 
 
 def drop(key: str):
@@ -40,10 +124,11 @@ def filecache(obj):
     Method decorator to easily cache method results
     """
     def wrapper(*args, **kwargs):
-        key = hashlib.md5(f"{obj.__name__}-{str(args)}-{str(kwargs)}".encode("utf-8")).hexdigest()
-        if exists(key):
-            return load(key)
-        result = obj(*args, **kwargs)
-        store(key, result)
+        key_material = f"{obj.__name__}-{str(args)}-{str(kwargs)}".encode("utf-8")
+        key = hashlib.blake2b(key_material, digest_size=16).hexdigest()
+        found, result = _read(key)
+        if not found:
+            result = obj(*args, **kwargs)
+            store(key, result)
         return result
     return wrapper
@@ -1,6 +1,6 @@
-from typing import List, Set
+from typing import Dict, List, Set
 
-from sfn_profiler.models import Event, Loop
+from sfn_profiler.models import Event, Loop, LoopIndex
 
 
 def find_loops_in_execution(history: List[Event]) -> List[Loop]:
@@ -8,21 +8,24 @@ def find_loops_in_execution(history: List[Event]) -> List[Loop]:
     loops: List[Loop] = []
     stack: List[Event] = []
     current_loop: Set[str] = set()
+    # Position of each step in the stack while no loop is being tracked, names are unique in the stack until then
+    positions: Dict[str, int] = {}
 
     for event in history:
         if not current_loop:
-            curr_stack_names: List[str] = list(e.name for e in stack)
-            if event.name in curr_stack_names:
-                idx = curr_stack_names.index(event.name)
-                current_loop = set(curr_stack_names[idx:])
+            idx = positions.get(event.name)
+            if idx is not None:
+                current_loop = set(e.name for e in stack[idx:])
                 stack = stack[idx:] + [event]
             else:
+                positions[event.name] = len(stack)
                 stack.append(event)
         elif current_loop and event.name not in current_loop:
             # Start a new potential loop
             loops.append(Loop.from_stack(stack))
             current_loop = set()
             stack = [event]
+            positions = {event.name: 0}
         else:  # current loop and state_name in current_loop
             stack.append(event)
     return loops
@@ -30,7 +33,8 @@ def find_loops_in_execution(history: List[Event]) -> List[Loop]:
 
 def coalesce_loop_events(execution_history: List[Event], loops: List[Loop]) -> List[Event]:
     """Remove loop events from the execution history."""
-    loops_removed = [event for event in execution_history if not any(event in loop for loop in loops)]
+    index = LoopIndex.from_loops(loops)
+    loops_removed = [event for event in execution_history if not index.contains_event(event.name, event.start)]
     for loop in loops:
         loops_removed.append(loop.to_event())
     return loops_removed
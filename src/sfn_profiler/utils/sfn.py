@@ -1,10 +1,13 @@
 
+import sys
+from functools import lru_cache
 from typing import List, Dict
 
 from sfn_profiler.clients.boto import get_account, get_region
 from sfn_profiler.models import ExecutionArn, Event
 
 
+@lru_cache(maxsize=4096)
 def get_execution_arn(id: str) -> ExecutionArn:
     split = id.split(':')
     if len(split) == 8:
@@ -16,38 +19,69 @@ def get_execution_arn(id: str) -> ExecutionArn:
     raise ValueError(f"Invalid execution id: {id}")
 
 
+# Kinds of history events that matter when pairing state entries with their exits
+_STATE_ENTERED, _TASK_FAILED, _STATE_EXITED, _OTHER = 1, 2, 3, 4
+_EVENT_KINDS: Dict[str, int] = {}
+
+
+def _classify_event_type(event_type: str) -> int:
+    # Step Functions event types are suffixed with their kind (TaskStateEntered, MapStateExited, ...), each type is
+    # classified once and then dispatched with a single dict lookup
+    if event_type.endswith('StateEntered'):
+        kind = _STATE_ENTERED
+    elif event_type.endswith('TaskFailed'):
+        kind = _TASK_FAILED
+    elif event_type.endswith('StateExited'):
+        kind = _STATE_EXITED
+    else:
+        kind = _OTHER
+    _EVENT_KINDS[event_type] = kind
+    return kind
+
+
 def process_execution_history(workflow: ExecutionArn, history: List[Dict], separate_retries=False) -> List[Event]:
     """Process execution history to get timing information for each state, including multi-state loops."""
-    state_timings: List[Event] = []
-    for start_i, event in enumerate(history):
-        if 'StateEntered' in event['type']:
-            state_name = event['stateEnteredEventDetails']['name']
-            start_time = event['timestamp']
-            # Find the corresponding StateExited event
-            attempts = 1
-            for curr_i, exit_event in enumerate(history[start_i + 1:], start_i + 1):
-                if 'TaskFailed' in exit_event['type']:
-                    next_event = history[curr_i + 1]
-                    # Look ahead, if the next event is not scheduling the task again, then we dont want to handle
-                    # the failure specifically and want to rely on the state itself exiting.
-                    # If the task is rescheduled, then we want to emit an event if combine_consecutive is False
-                    # or increment the attempts if combine consecutive is true
-                    if 'TaskStateExited' == next_event['type']:
-                        continue
+    # Each entered state gets its own slot so events come out in the order their states were entered,
+    # even though they are only completed once the matching exit is reached
+    slots: List[List[Event]] = []
+    # States entered but not yet exited, keyed by name. A state entered several times before it exits
+    # is closed by the first matching exit for all of its entries
+    pending: Dict[str, List[Dict]] = {}
+    event_kind = _EVENT_KINDS.get
+    for i, event in enumerate(history):
+        event_type = event['type']
+        kind = event_kind(event_type) or _classify_event_type(event_type)
+        if kind == _STATE_ENTERED:
+            # Interned so every event of the same state shares a single name string
+            state_name = sys.intern(event['stateEnteredEventDetails']['name'])
+            entry = {'name': state_name, 'start': event['timestamp'], 'attempts': 1, 'events': []}
+            slots.append(entry['events'])
+            pending.setdefault(state_name, []).append(entry)
+        elif kind == _TASK_FAILED:
+            if not pending:
+                continue
+            next_event = history[i + 1]
+            # Look ahead, if the next event is not scheduling the task again, then we dont want to handle
+            # the failure specifically and want to rely on the state itself exiting.
+            # If the task is rescheduled, then we want to emit an event if separate_retries is True
+            # or increment the attempts if separate_retries is False
+            if 'TaskStateExited' == next_event['type']:
+                continue
+            for entries in pending.values():
+                for entry in entries:
                     if separate_retries:
-                        end_time = exit_event['timestamp']
-                        state_timings.append(Event(start=start_time, end=end_time, name=state_name, workflow=workflow))
-                        start_time = next_event['timestamp']
+                        entry['events'].append(
+                            Event(start=entry['start'], end=event['timestamp'], name=entry['name'], workflow=workflow))
+                        entry['start'] = next_event['timestamp']
                     else:
-                        attempts += 1
-                elif 'StateExited' in exit_event['type'] and exit_event['stateExitedEventDetails']['name'] == state_name:
-                    end_time = exit_event['timestamp']
-                    state_timings.append(
-                        Event(
-                            start=start_time,
-                            end=end_time,
-                            name=state_name,
-                            workflow=workflow,
-                            attempts=attempts))
-                    break
-    return state_timings
+                        entry['attempts'] += 1
+        elif kind == _STATE_EXITED:
+            for entry in pending.pop(event['stateExitedEventDetails']['name'], ()):
+                entry['events'].append(
+                    Event(
+                        start=entry['start'],
+                        end=event['timestamp'],
+                        name=entry['name'],
+                        workflow=workflow,
+                        attempts=entry['attempts']))
+    return [event for events in slots for event in events]
@@ -0,0 +1,138 @@
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from sfn_profiler.cli.main import aggregate, create_timeline, downsample_bars
+from sfn_profiler.models import Event, ExecutionArn, Workflow
+
+
+ORIGIN = datetime(2023, 1, 1, 10, 0, 0)
+
+
+def downsample(bases, durations, resolution=1.0):
+    bases = np.asarray(bases, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    hovers = np.array([f"bar {i}" for i in range(bases.size)], dtype=object)
+    colors = np.array([f"color {i}" for i in range(bases.size)], dtype=object)
+    return downsample_bars("Task", ORIGIN, bases, durations, hovers, colors, resolution)
+
+
+def test_downsample_bars_merges_bars_closer_than_resolution():
+    """Test that bars separated by less than the resolution are merged into one bar."""
+    bases, durations, hovers, colors = downsample([0.0, 0.2, 0.5], [0.1, 0.5, 0.2])
+
+    assert bases.tolist() == [0.0]
+    assert durations.tolist() == [0.7]
+    assert hovers[0].startswith("State: Task<br>Start: 10:00:00")
+    assert "Merged steps: 3 (0.80s total)" in hovers[0]
+    # The merged bar takes the color of the longest bar in the run
+    assert colors.tolist() == ["color 1"]
+
+
+def test_downsample_bars_keeps_bars_further_apart_than_resolution():
+    """Test that bars separated by more than the resolution, including zero duration ones, are kept as they are."""
+    bases, durations, hovers, colors = downsample([0.0, 5.0, 10.0], [2.0, 3.0, 0.0])
+
+    assert bases.tolist() == [0.0, 5.0, 10.0]
+    assert durations.tolist() == [2.0, 3.0, 0.0]
+    assert hovers.tolist() == ["bar 0", "bar 1", "bar 2"]
+    assert colors.tolist() == ["color 0", "color 1", "color 2"]
+
+
+def test_downsample_bars_merged_bar_covers_its_inputs():
+    """Test that a merged bar starts with its first input and ends with the latest ending one."""
+    # The first bar outlasts the second, so the run must end with the first bar rather than the last one
+    bases, durations, _, _ = downsample([0.0, 0.5, 1.0, 6.0], [4.0, 0.5, 0.2, 1.0])
+
+    assert bases.tolist() == [0.0, 6.0]
+    assert durations.tolist() == [4.0, 1.0]
+
+
+def test_importing_cli_does_not_load_heavy_dependencies():
+    """Test that the CLI modules can be imported (e.g. to print --help) without loading numpy, pandas, plotly or jinja2."""
+    script = (
+        "import sys, sfn_profiler.cli.main, sfn_profiler.cli.sfn2perfetto; "
+        "print(sorted(m for m in ('numpy', 'pandas', 'plotly', 'jinja2') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "[]"
+
+
+def render_timeline(workflow, tmp_path, monkeypatch):
+    """Run create_timeline and return the figure it would have written."""
+    figures = []
+    monkeypatch.setattr(go.Figure, "write_html", lambda figure, path: figures.append(figure))
+    create_timeline(workflow, str(tmp_path))
+    return {trace.name: trace for trace in figures[0].data}
+
+
+def test_create_timeline_colors_each_bar_by_its_own_duration(tmp_path, monkeypatch):
+    """Test that every bar of a task is colored by its own duration and contributor bars are gray."""
+    execution = ExecutionArn("123456789012", "us-east-1", "StateMachine", "Execution")
+    contributor = ExecutionArn("123456789012", "us-east-1", "StateMachine", "Contributor")
+    start = datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+    workflow = Workflow(id=execution, events=[
+        Event(start=start, end=start + timedelta(minutes=1), name="Step", workflow=execution),
+        Event(start=start + timedelta(minutes=2), end=start + timedelta(minutes=4), name="Step", workflow=execution),
+        Event(start=start + timedelta(minutes=1), end=start + timedelta(minutes=3), name="Other", workflow=contributor),
+    ], loops=[])
+
+    traces = render_timeline(workflow, tmp_path, monkeypatch)
+
+    step = traces["Step"]
+    assert list(step.marker.color) == px.colors.sample_colorscale(px.colors.sequential.YlOrRd, [0.5, 1.0])
+    assert list(traces["Other"].marker.color) == ["rgba(50, 50, 50, 0.3)"]
+
+
+def test_create_timeline_bars_match_event_offsets_and_durations(tmp_path, monkeypatch):
+    """Test that each bar starts at its event's offset from the workflow start and spans its duration."""
+    execution = ExecutionArn("123456789012", "us-east-1", "StateMachine", "Execution")
+    start = datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+    workflow = Workflow(id=execution, events=[
+        Event(start=start, end=start + timedelta(seconds=30), name="First", workflow=execution),
+        Event(start=start + timedelta(seconds=30), end=start + timedelta(seconds=90), name="Second", workflow=execution),
+        Event(start=start + timedelta(seconds=90), end=start + timedelta(seconds=100), name="First", workflow=execution),
+    ], loops=[])
+
+    traces = render_timeline(workflow, tmp_path, monkeypatch)
+
+    assert list(traces["First"].base) == [0.0, 90.0]
+    assert list(traces["First"].x) == [30.0, 10.0]
+    assert list(traces["Second"].base) == [30.0]
+    assert list(traces["Second"].x) == [60.0]
+
+
+def test_aggregate_groups_events_by_step_name():
+    """Test that contributor events are aggregated per step, in order of first appearance."""
+    first = ExecutionArn("123456789012", "us-east-1", "StateMachine", "First")
+    second = ExecutionArn("123456789012", "us-east-1", "StateMachine", "Second")
+    start = datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+    events = [
+        Event(start=start + timedelta(minutes=1), end=start + timedelta(minutes=3), name="B", workflow=first),
+        Event(start=start, end=start + timedelta(minutes=1), name="A", workflow=first),
+        Event(start=start, end=start + timedelta(minutes=4), name="B", workflow=second),
+        Event(start=start + timedelta(minutes=5), end=start + timedelta(minutes=7), name="A", workflow=second),
+    ]
+
+    result = aggregate(events)
+
+    assert list(result) == ["B", "A"]
+    assert result["B"].name == "B"
+    assert result["B"].start == start
+    assert result["B"].end == start + timedelta(minutes=4)
+    assert result["B"].values == [timedelta(minutes=2), timedelta(minutes=4)]
+    assert result["B"].contributors == {first, second}
+    assert result["A"].start == start
+    assert result["A"].end == start + timedelta(minutes=7)
+    assert result["A"].values == [timedelta(minutes=1), timedelta(minutes=2)]
+    assert result["A"].contributors == {first, second}
+
+
+def test_aggregate_empty():
+    """Test that aggregating no events gives no steps."""
+    assert aggregate([]) == {}
@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from sfn_profiler.cli.sfn2perfetto import encode_varint, execution_trace_packets, generate_trace_packets, write_trace
+from sfn_profiler.models import Event, ExecutionArn
+from sfn_profiler.models.perfetto.perfetto_trace_pb2 import Trace
+
+
+def test_encode_varint():
+    """Test that integers are encoded as protobuf base 128 varints."""
+    assert encode_varint(0) == b"\x00"
+    assert encode_varint(127) == b"\x7f"
+    assert encode_varint(128) == b"\x80\x01"
+    assert encode_varint(300) == b"\xac\x02"
+
+
+def test_write_trace_matches_serialized_trace(tmp_path):
+    """Test that the streamed packets are byte for byte the serialization of a Trace holding them."""
+    execution = ExecutionArn(account="123456789012", region="us-east-1", state_machine="test", execution="test")
+    start = datetime(2023, 1, 1, 10, 0, 0)
+    # The long name makes some packets longer than 127 bytes, so their lengths take multi-byte varints
+    names = ["State1", "State2", "State" + "x" * 200, "State1"]
+    events = [
+        Event(start=start + timedelta(minutes=i), end=start + timedelta(minutes=i + 1), name=name, workflow=execution)
+        for i, name in enumerate(names)
+    ]
+    packets = generate_trace_packets(1, execution, events)
+    output_file = tmp_path / "trace.perfetto"
+
+    write_trace(packets, str(output_file))
+
+    assert output_file.read_bytes() == Trace(packet=packets).SerializeToString()
+
+
+class FakeSfnClient:
+    """Serves the same single-state history for every execution and records which ones were fetched."""
+
+    def __init__(self):
+        self.fetched = []
+
+    def get_state_machine_info(self, arn):
+        self.fetched.append(arn)
+        return {}, [
+            {
+                "type": "TaskStateEntered",
+                "stateEnteredEventDetails": {"name": "State1"},
+                "timestamp": datetime(2023, 1, 1, 10, 0, 0),
+            },
+            {
+                "type": "TaskStateExited",
+                "stateExitedEventDetails": {"name": "State1"},
+                "timestamp": datetime(2023, 1, 1, 10, 1, 0),
+            },
+        ]
+
+
+def test_execution_trace_packets_streams_executions_with_unique_track_ids():
+    """Test that executions are fetched as their packets are consumed, with track ids offset across executions."""
+    client = FakeSfnClient()
+    executions = [
+        "arn:aws:states:us-east-1:123456789012:execution:test:first",
+        "arn:aws:states:us-east-1:123456789012:execution:test:second",
+    ]
+
+    packets = execution_trace_packets(client, executions)
+    first = next(packets)
+    assert len(client.fetched) == 1
+
+    # Each execution has a process track, a thread track and a begin and end slice, so the second one starts at 4 + 1
+    packets = [first, *packets]
+    assert len(client.fetched) == 2
+    assert [p.track_descriptor.uuid for p in packets if p.HasField("track_descriptor")] == [0, 1, 5, 6]
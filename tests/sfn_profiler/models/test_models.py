@@ -1,12 +1,18 @@
+import pickle
+from dataclasses import FrozenInstanceError
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 from typing import List
 
 import pytest
 import unittest
 
 from sfn_profiler.models import AggregateEvent
-from sfn_profiler.models import Workflow, Event, Loop, ExecutionArn
+from sfn_profiler.models import Workflow, Event, Loop, LoopIndex, ExecutionArn
+
+# Fixed reference time for tests that do not care about the actual timestamps
+NOW = datetime(2024, 1, 1, 0, 0, 0)
 
 
 class TestInit(unittest.TestCase):
@@ -263,6 +269,41 @@ class TestInit(unittest.TestCase):
         assert workflow._end == initial_end
         assert len(workflow.events) == 0
 
+    def test_columns_rebuilt_after_add_events(self):
+        """
+        Test that the columnar view of a Workflow reflects its events and is rebuilt once more events are added.
+        """
+        start = datetime(2023, 1, 1, 10, 0, tzinfo=timezone.utc)
+        event1 = Event(start, start + timedelta(seconds=90), "Event1", "test_workflow")
+        event2 = Event(start + timedelta(seconds=90), start + timedelta(seconds=100), "Event2", "test_workflow")
+        workflow = Workflow("test_workflow", [event1], [])
+
+        assert workflow.columns.names.tolist() == ["Event1"]
+        assert workflow.columns.durations.tolist() == [90.0]
+
+        workflow.add_events([event2, event1])
+
+        assert workflow.columns.names.tolist() == ["Event1", "Event2", "Event1"]
+        assert workflow.columns.name_codes.tolist() == [0, 1, 0]
+        assert workflow.columns.unique_names == ["Event1", "Event2"]
+        assert workflow.columns.durations.tolist() == [90.0, 10.0, 90.0]
+
+    def test_own_events_rebuilt_after_add_events(self):
+        """
+        Test that the mask of a Workflow's own events excludes contributor events, including ones added later.
+        """
+        start = datetime(2023, 1, 1, 10, 0, tzinfo=timezone.utc)
+        own = Event(start, start + timedelta(seconds=90), "Event1", "test_workflow")
+        contributed = Event(start, start + timedelta(seconds=10), "Event1", "contributor")
+        workflow = Workflow("test_workflow", [own], [])
+
+        assert workflow.own_events.tolist() == [True]
+
+        workflow.add_events([contributed])
+
+        assert workflow.own_events.tolist() == [True, False]
+        assert workflow.largest_contributors() == [("Event1", 90.0)]
+
     def test_duration_returns_correct_timedelta(self):
         """
         Test that the duration property of Event returns the correct timedelta
@@ -348,8 +389,7 @@ class TestInit(unittest.TestCase):
         Test the duration property when start and end times are identical.
         This is an edge case where the duration should be zero.
         """
-        now = datetime.now()
-        loop = Loop(name="test", start=now, end=now, iterations=1, events=[], names=set())
+        loop = Loop(name="test", start=NOW, end=NOW, iterations=1, events=[], names=set())
         assert loop.duration == timedelta(0), "Duration should be zero when start and end times are identical"
 
     def test_duration_with_no_events(self):
@@ -372,6 +412,33 @@ class TestInit(unittest.TestCase):
 
         assert workflow.duration == timedelta(0), "Duration should be zero for a single instantaneous event"
 
+    def test_duration_updates_after_add_event(self):
+        """
+        Test that the duration of an AggregateEvent reflects events added after it was first read.
+        """
+        arn = ExecutionArn("123456789012", "us-west-2", "StateMachine", "Execution")
+        aggregate = AggregateEvent.from_event(
+            Event(start=datetime(2023, 1, 1, 1), end=datetime(2023, 1, 1, 2), name="Event1", workflow=arn))
+        assert aggregate.duration == timedelta(hours=1)
+
+        aggregate.add_event(Event(start=datetime(2023, 1, 1, 0), end=datetime(2023, 1, 1, 3), name="Event1", workflow=arn))
+
+        assert aggregate.duration == timedelta(hours=3)
+        assert aggregate.total_seconds() == 3 * 3600
+
+    def test_duration_updates_after_moving_event(self):
+        """
+        Test that the cached duration of an Event follows its start and end when they are moved.
+        """
+        arn = ExecutionArn("123456789012", "us-west-2", "StateMachine", "Execution")
+        event = Event(start=datetime(2023, 1, 1, 1), end=datetime(2023, 1, 1, 2), name="Event1", workflow=arn)
+
+        event.end = datetime(2023, 1, 1, 4)
+        assert event.duration == timedelta(hours=3)
+        event.start = datetime(2023, 1, 1, 3)
+        assert event.duration == timedelta(hours=1)
+        assert event.total_seconds() == 3600
+
     def test_durations_empty_values(self):
         """
         Test the durations method when the values list is empty.
@@ -470,7 +537,7 @@ class TestInit(unittest.TestCase):
         loop = Loop.from_stack(events)
 
         # Assert the results
-        assert loop.simple_name == "Event1|Event2" or loop.simple_name == "Event2|Event1"
+        assert loop.simple_name == "Event1|Event2"
         assert loop.start == datetime(2023, 1, 1, 10, 0)
         assert loop.end == datetime(2023, 1, 1, 10, 3)
         assert loop.iterations == 2
@@ -502,13 +569,30 @@ class TestInit(unittest.TestCase):
         assert len(loop.events) == 1
         assert len(loop.names) == 1
 
+    def test_from_stack_name_lists_each_step_once(self):
+        """
+        Test that the loop name lists each step once, sorted, and is shared by loops over the same steps.
+        """
+        workflow = ExecutionArn("123456789012", "us-west-2", "StateMachine", "Execution")
+        events = [
+            Event(start=datetime(2023, 1, 1, 10, i), end=datetime(2023, 1, 1, 10, i + 1), name=name, workflow=workflow)
+            for i, name in enumerate(["B", "A", "B", "A", "B"])
+        ]
+
+        first = Loop.from_stack(events[:4])
+        second = Loop.from_stack(events[1:])
+
+        assert first.name == "A|B"
+        assert first.name is second.name
+        assert second.iterations == 2
+
     def test_id_as_filename_1(self):
         """
         Test that id_as_filename correctly replaces ':' and '/' with '-' in the workflow ID.
         """
         # Create a sample Workflow instance
         execution_arn = ExecutionArn(account="123456789012", region="us-west-2", state_machine="MyStateMachine", execution="MyExecution")
-        sample_event = Event(start=datetime.now(), end=datetime.now() + timedelta(seconds=10), name="SampleEvent", workflow=execution_arn)
+        sample_event = Event(start=NOW, end=NOW + timedelta(seconds=10), name="SampleEvent", workflow=execution_arn)
         workflow = Workflow(id="arn:aws:states:us-west-2:123456789012:execution:MyStateMachine:MyExecution", events=[sample_event], loops=[])
 
         # Call the method under test
@@ -527,8 +611,8 @@ class TestInit(unittest.TestCase):
             id="arn:aws:states:us-east-1:123456789012:execution:StateMachine-1234567890abcdef:execution-1234567890abcdef",
             events=[],
             loops=[],
-            _start=datetime.now(),
-            _end=datetime.now()
+            _start=NOW,
+            _end=NOW
         )
 
         result = workflow.id_as_filename()
@@ -602,6 +686,24 @@ class TestInit(unittest.TestCase):
         assert result[0][0].startswith("[LOOP]"), "Expected Event1 to be loop"
         assert result[0][1] == 36*60*60
 
+    def test_largest_contributors_overlapping_loops(self):
+        """
+        Test that an event is excluded when it falls within any of several overlapping loops sharing its name,
+        and counted when it only matches a loop by time but not by name.
+        """
+        execution_arn = ExecutionArn.parse("arn:aws:states:us-west-2:123456789012:execution:state-machine:execution")
+        event1 = Event(start=datetime(2023, 1, 1, 3), end=datetime(2023, 1, 1, 4), name="Event1", workflow=execution_arn)
+        event2 = Event(start=datetime(2023, 1, 1, 5), end=datetime(2023, 1, 1, 6), name="Event2", workflow=execution_arn)
+        wide_loop = Loop(name="WideLoop", start=datetime(2023, 1, 1, 0), end=datetime(2023, 1, 1, 6),
+                         iterations=2, events=[], names={"Event1"})
+        narrow_loop = Loop(name="NarrowLoop", start=datetime(2023, 1, 1, 1), end=datetime(2023, 1, 1, 2),
+                           iterations=2, events=[], names={"Event1", "Event2"})
+        workflow = Workflow(id=execution_arn, events=[event1, event2], loops=[wide_loop, narrow_loop])
+
+        result = dict(workflow._largest_contributors(with_loops=True))
+        assert "Event1" not in result
+        assert result["Event2"] == 60*60
+
     def test_largest_contributors_empty_events(self):
         """
         Test the _largest_contributors method when the Workflow has no events.
@@ -653,6 +755,39 @@ class TestInit(unittest.TestCase):
         result = workflow.largest_contributors(n=0)
         assert result == [], "Expected an empty list when n is zero"
 
+    def test_loop_index_contains_event_merges_overlapping_spans(self):
+        """
+        Test that LoopIndex matches steps by name within the union of overlapping loop spans, like Loop.__contains__.
+        """
+        first = Loop(name="A|B", start=datetime(2023, 1, 1, 0), end=datetime(2023, 1, 1, 2),
+                     iterations=1, events=[], names=frozenset({"A", "B"}))
+        second = Loop(name="A", start=datetime(2023, 1, 1, 1), end=datetime(2023, 1, 1, 3),
+                      iterations=1, events=[], names=frozenset({"A"}))
+        index = LoopIndex.from_loops([first, second])
+
+        assert index.spans["A"] == ([datetime(2023, 1, 1, 0)], [datetime(2023, 1, 1, 3)])
+        assert index.contains_event("A", datetime(2023, 1, 1, 2, 30))
+        assert not index.contains_event("B", datetime(2023, 1, 1, 2, 30))
+        assert not index.contains_event("C", datetime(2023, 1, 1, 1))
+        assert not index.contains_event("A", datetime(2022, 12, 31))
+
+    def test_event_in_any_loop(self):
+        """
+        Test that a Workflow finds events within any of its loops, matching both name and time span.
+        """
+        arn = ExecutionArn("123456789012", "us-west-2", "StateMachine", "Execution")
+        loop = Loop(name="A|B", start=datetime(2023, 1, 1, 1), end=datetime(2023, 1, 1, 2),
+                    iterations=2, events=[], names=frozenset({"A", "B"}))
+        workflow = Workflow(id=arn, events=[], loops=[loop])
+
+        inside = Event(start=datetime(2023, 1, 1, 1, 30), end=datetime(2023, 1, 1, 1, 40), name="A", workflow=arn)
+        other_step = Event(start=datetime(2023, 1, 1, 1, 30), end=datetime(2023, 1, 1, 1, 40), name="C", workflow=arn)
+        after = Event(start=datetime(2023, 1, 1, 3), end=datetime(2023, 1, 1, 4), name="A", workflow=arn)
+
+        assert workflow.event_in_any_loop(inside)
+        assert not workflow.event_in_any_loop(other_step)
+        assert not workflow.event_in_any_loop(after)
+
     def test_parse_empty_arn(self):
         """
         Test that parse method raises ValueError when given an empty ARN string.
@@ -697,11 +832,40 @@ class TestInit(unittest.TestCase):
         assert result.state_machine == "my-state-machine"
         assert result.execution == "my-execution"
 
+    def test_parse_result_is_hashable_and_immutable(self):
+        """
+        Test that equal ARNs hash equally, survive pickling and cannot be modified after creation.
+        """
+        arn = ExecutionArn.parse("arn:aws:states:us-west-2:123456789012:execution:my-state-machine:my-execution")
+        same = ExecutionArn(account="123456789012", region="us-west-2",
+                            state_machine="my-state-machine", execution="my-execution")
+
+        assert hash(arn) == hash(same)
+        assert {arn: 1}[same] == 1
+        assert pickle.loads(pickle.dumps(arn)) == arn
+        with pytest.raises(FrozenInstanceError):
+            arn.execution = "other-execution"
+
+    def test_slotted_models_have_no_instance_dict(self):
+        """
+        Test that events and workflows are slotted, and still compare and pickle like regular dataclasses.
+        """
+        arn = ExecutionArn("123456789012", "us-west-2", "StateMachine", "Execution")
+        event = Event(start=datetime(2023, 1, 1), end=datetime(2023, 1, 1, 1), name="Event1", workflow=arn)
+        workflow = Workflow(id=arn, events=[event], loops=[])
+
+        assert not hasattr(event, "__dict__")
+        assert not hasattr(workflow, "__dict__")
+        assert pickle.loads(pickle.dumps(event)) == event
+        assert str(arn) == "arn:aws:states:us-west-2:123456789012:execution:StateMachine:Execution"
+        # The ARN string is formatted once and reused
+        assert str(arn) is str(arn)
+
     def test_simple_name_1(self):
         """
         Test that the simple_name property correctly joins the names in the Loop object.
         This test verifies that the simple_name method returns a string that is the result of
-        joining the set of names in the Loop object with the '|' character.
+        joining the sorted names in the Loop object with the '|' character.
         """
         # Create a sample Loop object
         loop = Loop(
@@ -730,7 +894,7 @@ class TestInit(unittest.TestCase):
         result = loop.simple_name
 
         # Assert that the result is the expected joined string
-        assert result == "Event1|Event2" or result == "Event2|Event1"
+        assert result == "Event1|Event2"
 
     def test_simple_name_with_empty_names_set(self):
         """
@@ -739,8 +903,8 @@ class TestInit(unittest.TestCase):
         """
         loop = Loop(
             name="empty_loop",
-            start=datetime.now(),
-            end=datetime.now() + timedelta(seconds=10),
+            start=NOW,
+            end=NOW + timedelta(seconds=10),
             iterations=0,
             events=[],
             names=set()
@@ -1023,8 +1187,8 @@ class TestInit(unittest.TestCase):
         any other value, which would be incorrect based on the implementation.
         """
         event = AggregateEvent(
-            start=datetime.now(),
-            end=datetime.now() + timedelta(seconds=10),
+            start=NOW,
+            end=NOW + timedelta(seconds=10),
             name="TestEvent",
             values=[timedelta(seconds=5)],
             contributors={ExecutionArn("123456789012", "us-west-2", "StateMachine", "Execution")}
@@ -0,0 +1,107 @@
+import gc
+import pickle
+from datetime import datetime, timezone
+
+import pytest
+
+from sfn_profiler.utils import cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Point the cache at a temporary directory."""
+    monkeypatch.setattr(cache, "_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_store_and_load_execution_info():
+    """Test that an (execution details, history) tuple spanning several chunks round trips unchanged."""
+    details = {"executionArn": "arn", "status": "SUCCEEDED"}
+    history = [
+        {"id": i, "type": "TaskStateEntered", "timestamp": datetime(2023, 1, 1, tzinfo=timezone.utc)}
+        for i in range(cache.CHUNK_SIZE * 2 + 1)
+    ]
+
+    cache.store("execution", (details, history))
+
+    assert cache.load("execution") == (details, history)
+
+
+def test_store_and_load_empty_list_in_tuple():
+    """Test that empty lists inside tuples round trip."""
+    cache.store("empty", ({}, []))
+
+    assert cache.load("empty") == ({}, [])
+
+
+def test_store_and_load_non_tuple():
+    """Test that values other than tuples are stored whole."""
+    cache.store("value", {"a": [1, 2, 3]})
+
+    assert cache.load("value") == {"a": [1, 2, 3]}
+
+
+def test_load_whole_pickle_entry(cache_dir):
+    """Test that entries written as a single pickle are still readable."""
+    with open(cache_dir / "legacy.pkl", "wb") as f:
+        pickle.dump(({"status": "SUCCEEDED"}, [{"id": 1}]), f)
+
+    assert cache.load("legacy") == ({"status": "SUCCEEDED"}, [{"id": 1}])
+
+
+def test_failed_store_leaves_no_temporary_file(cache_dir):
+    """Test that a value that cannot be pickled leaves neither an entry nor a temporary file behind."""
+    with pytest.raises(Exception):
+        cache.store("broken", ({}, [lambda: None]))
+
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_load_missing_key():
+    """Test that loading a key that was never stored returns None."""
+    assert cache.load("missing") is None
+
+
+def test_expired_entry_is_not_loaded():
+    """Test that an entry older than the expiry is treated as missing."""
+    cache.store("expired", {"a": 1})
+
+    assert cache.exists("expired")
+    assert not cache.exists("expired", expiry=0)
+    assert cache.load("expired", expiry=0) is None
+
+
+def test_filecache_only_calls_function_once():
+    """Test that the decorated function is only invoked on a cache miss."""
+    calls = []
+
+    @cache.filecache
+    def fetch(arn):
+        calls.append(arn)
+        return {"arn": arn}, [{"id": 1}]
+
+    assert fetch("arn-1") == ({"arn": "arn-1"}, [{"id": 1}])
+    assert fetch("arn-1") == ({"arn": "arn-1"}, [{"id": 1}])
+    assert calls == ["arn-1"]
+
+
+def test_filecache_returns_independent_results():
+    """Test that each call gets its own copy of the cached result, so mutating one does not affect later calls."""
+    @cache.filecache
+    def fetch(arn):
+        return {"arn": arn}, [{"id": 1}]
+
+    first = fetch("arn-2")
+    first[1][0]["id"] = 2
+
+    second = fetch("arn-2")
+    assert second == ({"arn": "arn-2"}, [{"id": 1}])
+    assert second[1] is not first[1]
+
+
+def test_load_restores_garbage_collection():
+    """Test that the garbage collector is enabled again once an entry is loaded."""
+    cache.store("gc", ({}, [{"id": 1}]))
+
+    assert cache.load("gc") == ({}, [{"id": 1}])
+    assert gc.isenabled()
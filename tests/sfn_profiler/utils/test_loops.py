@@ -3,131 +3,67 @@ from datetime import datetime
 from sfn_profiler.models import Event, Loop, ExecutionArn
 from sfn_profiler.utils.loops import find_loops_in_execution, coalesce_loop_events
 
+
+def make_event(minute, name, workflow):
+    """Create an event that starts at the given minute past 10:00 and lasts one minute."""
+    return Event(
+        start=datetime(2023, 1, 1, 10, minute),
+        end=datetime(2023, 1, 1, 10, minute + 1),
+        name=name,
+        workflow=workflow
+    )
+
+
 # Test fixtures
-@pytest.fixture
+@pytest.fixture(scope="module")
 def execution_arn():
     """Create a sample execution ARN for testing."""
     return ExecutionArn(account="123456789012", region="us-east-1", state_machine="test", execution="test")
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def simple_events(execution_arn):
     """Create a simple list of events with no loops."""
     return [
-        Event(
-            start=datetime(2023, 1, 1, 10, 0, 0),
-            end=datetime(2023, 1, 1, 10, 1, 0),
-            name="State1",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 1, 0),
-            end=datetime(2023, 1, 1, 10, 2, 0),
-            name="State2",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 2, 0),
-            end=datetime(2023, 1, 1, 10, 3, 0),
-            name="State3",
-            workflow=execution_arn
-        ),
+        make_event(0, "State1", execution_arn),
+        make_event(1, "State2", execution_arn),
+        make_event(2, "State3", execution_arn),
     ]
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def events_with_loop(execution_arn):
     """Create a list of events with a simple loop."""
     return [
-        Event(
-            start=datetime(2023, 1, 1, 10, 0, 0),
-            end=datetime(2023, 1, 1, 10, 1, 0),
-            name="State1",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 1, 0),
-            end=datetime(2023, 1, 1, 10, 2, 0),
-            name="State2",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 2, 0),
-            end=datetime(2023, 1, 1, 10, 3, 0),
-            name="State1",  # Loop back to State1
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 3, 0),
-            end=datetime(2023, 1, 1, 10, 4, 0),
-            name="State2",  # Continue loop
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 4, 0),
-            end=datetime(2023, 1, 1, 10, 5, 0),
-            name="State3",  # Exit the loop
-            workflow=execution_arn
-        ),
+        make_event(0, "State1", execution_arn),
+        make_event(1, "State2", execution_arn),
+        make_event(2, "State1", execution_arn),  # Loop back to State1
+        make_event(3, "State2", execution_arn),  # Continue loop
+        make_event(4, "State3", execution_arn),  # Exit the loop
     ]
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def events_with_multiple_loops(execution_arn):
     """Create a list of events with multiple separate loops."""
     return [
-        Event(
-            start=datetime(2023, 1, 1, 10, 0, 0),
-            end=datetime(2023, 1, 1, 10, 1, 0),
-            name="State1",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 1, 0),
-            end=datetime(2023, 1, 1, 10, 2, 0),
-            name="State2",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 2, 0),
-            end=datetime(2023, 1, 1, 10, 3, 0),
-            name="State1",  # First loop
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 3, 0),
-            end=datetime(2023, 1, 1, 10, 4, 0),
-            name="State3",  # Exit first loop
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 4, 0),
-            end=datetime(2023, 1, 1, 10, 5, 0),
-            name="State4",
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 5, 0),
-            end=datetime(2023, 1, 1, 10, 6, 0),
-            name="State4",  # Second loop
-            workflow=execution_arn
-        ),
-        Event(
-            start=datetime(2023, 1, 1, 10, 6, 0),
-            end=datetime(2023, 1, 1, 10, 7, 0),
-            name="State5",  # Exit second loop
-            workflow=execution_arn
-        ),
+        make_event(0, "State1", execution_arn),
+        make_event(1, "State2", execution_arn),
+        make_event(2, "State1", execution_arn),  # First loop
+        make_event(3, "State3", execution_arn),  # Exit first loop
+        make_event(4, "State4", execution_arn),
+        make_event(5, "State4", execution_arn),  # Second loop
+        make_event(6, "State5", execution_arn),  # Exit second loop
     ]
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def nested_loop_events(execution_arn):
     """Create events with a nested loop structure."""
     return [
-        Event(start=datetime(2023, 1, 1, 10, 0), end=datetime(2023, 1, 1, 10, 1), name="A", workflow=execution_arn),
-        Event(start=datetime(2023, 1, 1, 10, 1), end=datetime(2023, 1, 1, 10, 2), name="B", workflow=execution_arn),
-        Event(start=datetime(2023, 1, 1, 10, 2), end=datetime(2023, 1, 1, 10, 3), name="C", workflow=execution_arn),
-        Event(start=datetime(2023, 1, 1, 10, 3), end=datetime(2023, 1, 1, 10, 4), name="B", workflow=execution_arn),  # Inner loop
-        Event(start=datetime(2023, 1, 1, 10, 4), end=datetime(2023, 1, 1, 10, 5), name="C", workflow=execution_arn),  # Inner loop
-        Event(start=datetime(2023, 1, 1, 10, 5), end=datetime(2023, 1, 1, 10, 6), name="A", workflow=execution_arn),  # Outer loop
-        Event(start=datetime(2023, 1, 1, 10, 6), end=datetime(2023, 1, 1, 10, 7), name="D", workflow=execution_arn),  # Exit all loops
+        make_event(0, "A", execution_arn),
+        make_event(1, "B", execution_arn),
+        make_event(2, "C", execution_arn),
+        make_event(3, "B", execution_arn),  # Inner loop
+        make_event(4, "C", execution_arn),  # Inner loop
+        make_event(5, "A", execution_arn),  # Outer loop
+        make_event(6, "D", execution_arn),  # Exit all loops
     ]
 
 
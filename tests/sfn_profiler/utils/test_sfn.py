@@ -24,6 +24,7 @@ class TestGetExecutionArn:
     @patch('sfn_profiler.utils.sfn.get_region', return_value='us-west-2')
     def test_short_format(self, mock_region, mock_account):
         """Test parsing a shortened 'state_machine:execution' format."""
+        get_execution_arn.cache_clear()
         short_id = "my-state-machine:my-execution"
         result = get_execution_arn(short_id)
 
@@ -37,6 +38,20 @@ class TestGetExecutionArn:
         mock_account.assert_called_once()
         mock_region.assert_called_once()
 
+    @patch('sfn_profiler.utils.sfn.get_account', return_value='987654321098')
+    @patch('sfn_profiler.utils.sfn.get_region', return_value='us-west-2')
+    def test_repeated_id_is_resolved_once(self, mock_region, mock_account):
+        """Test that resolving the same id again reuses the previously resolved ARN."""
+        get_execution_arn.cache_clear()
+        short_id = "my-state-machine:my-repeated-execution"
+
+        first = get_execution_arn(short_id)
+        second = get_execution_arn(short_id)
+
+        assert first is second
+        mock_account.assert_called_once()
+        mock_region.assert_called_once()
+
     def test_invalid_format(self):
         """Test that invalid formats raise a ValueError."""
         invalid_id = "invalid-format-without-colon"
@@ -47,125 +62,129 @@ class TestGetExecutionArn:
         assert "Invalid execution id" in str(excinfo.value)
 
 
-class TestProcessExecutionHistory:
+@pytest.fixture(scope="module")
+def sample_workflow():
+    """Create a sample ExecutionArn for testing."""
+    return ExecutionArn(
+        account="123456789012",
+        region="us-east-1",
+        state_machine="test-machine",
+        execution="test-execution"
+    )
+
+
+@pytest.fixture(scope="module")
+def simple_history():
+    """Create a simple execution history with no failures."""
+    return [
+        {
+            "type": "TaskStateEntered",
+            "stateEnteredEventDetails": {"name": "State1"},
+            "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+        },
+        {
+            "type": "StateExited",
+            "stateExitedEventDetails": {"name": "State1"},
+            "timestamp": datetime(2023, 1, 1, 10, 1, 0, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskStateEntered",
+            "stateEnteredEventDetails": {"name": "State2"},
+            "timestamp": datetime(2023, 1, 1, 10, 1, 30, tzinfo=timezone.utc)
+        },
+        {
+            "type": "StateExited",
+            "stateExitedEventDetails": {"name": "State2"},
+            "timestamp": datetime(2023, 1, 1, 10, 2, 0, tzinfo=timezone.utc)
+        }
+    ]
+
+
+@pytest.fixture(scope="module")
+def history_with_retries():
+    """Create an execution history with task failures and retries."""
+    return [
+        # First state (successful)
+        {
+            "type": "TaskStateEntered",
+            "stateEnteredEventDetails": {"name": "SuccessState"},
+            "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskStateExited",
+            "stateExitedEventDetails": {"name": "SuccessState"},
+            "timestamp": datetime(2023, 1, 1, 10, 1, 0, tzinfo=timezone.utc)
+        },
+
+        # Second state with retries
+        {
+            "type": "TaskStateEntered",
+            "stateEnteredEventDetails": {"name": "RetryState"},
+            "timestamp": datetime(2023, 1, 1, 10, 1, 30, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskScheduled",
+            "timestamp": datetime(2023, 1, 1, 10, 1, 35, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskFailed",
+            "timestamp": datetime(2023, 1, 1, 10, 1, 45, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskScheduled", # Retry
+            "timestamp": datetime(2023, 1, 1, 10, 2, 0, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskFailed",
+            "timestamp": datetime(2023, 1, 1, 10, 2, 15, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskScheduled", # Second retry
+            "timestamp": datetime(2023, 1, 1, 10, 2, 30, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskSucceeded",
+            "timestamp": datetime(2023, 1, 1, 10, 3, 0, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskStateExited",
+            "stateExitedEventDetails": {"name": "RetryState"},
+            "timestamp": datetime(2023, 1, 1, 10, 3, 5, tzinfo=timezone.utc)
+        }
+    ]
+
+
+@pytest.fixture(scope="module")
+def history_with_task_failure_then_exit():
+    """Create a history where a task fails and the next event is StateExited (no retry)."""
+    return [
+        {
+            "type": "TaskStateEntered",
+            "stateEnteredEventDetails": {"name": "FailState"},
+            "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskScheduled",
+            "timestamp": datetime(2023, 1, 1, 10, 0, 5, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskFailed",
+            "timestamp": datetime(2023, 1, 1, 10, 0, 15, tzinfo=timezone.utc)
+        },
+        {
+            "type": "TaskStateExited", # Immediate exit after failure (no retry)
+            "stateExitedEventDetails": {"name": "FailState"},
+            "timestamp": datetime(2023, 1, 1, 10, 0, 16, tzinfo=timezone.utc)
+        },
+        {
+            "type": "ExecutionSucceeded",
+            "stateExitedEventDetails": {"name": "FailState"},
+            "timestamp": datetime(2023, 1, 1, 10, 0, 20, tzinfo=timezone.utc)
+        }
+    ]
 
-    @pytest.fixture
-    def sample_workflow(self):
-        """Create a sample ExecutionArn for testing."""
-        return ExecutionArn(
-            account="123456789012",
-            region="us-east-1",
-            state_machine="test-machine",
-            execution="test-execution"
-        )
-
-    @pytest.fixture
-    def simple_history(self):
-        """Create a simple execution history with no failures."""
-        return [
-            {
-                "type": "TaskStateEntered",
-                "stateEnteredEventDetails": {"name": "State1"},
-                "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
-            },
-            {
-                "type": "StateExited",
-                "stateExitedEventDetails": {"name": "State1"},
-                "timestamp": datetime(2023, 1, 1, 10, 1, 0, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskStateEntered",
-                "stateEnteredEventDetails": {"name": "State2"},
-                "timestamp": datetime(2023, 1, 1, 10, 1, 30, tzinfo=timezone.utc)
-            },
-            {
-                "type": "StateExited",
-                "stateExitedEventDetails": {"name": "State2"},
-                "timestamp": datetime(2023, 1, 1, 10, 2, 0, tzinfo=timezone.utc)
-            }
-        ]
 
-    @pytest.fixture
-    def history_with_retries(self):
-        """Create an execution history with task failures and retries."""
-        return [
-            # First state (successful)
-            {
-                "type": "TaskStateEntered",
-                "stateEnteredEventDetails": {"name": "SuccessState"},
-                "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskStateExited",
-                "stateExitedEventDetails": {"name": "SuccessState"},
-                "timestamp": datetime(2023, 1, 1, 10, 1, 0, tzinfo=timezone.utc)
-            },
-
-            # Second state with retries
-            {
-                "type": "TaskStateEntered",
-                "stateEnteredEventDetails": {"name": "RetryState"},
-                "timestamp": datetime(2023, 1, 1, 10, 1, 30, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskScheduled",
-                "timestamp": datetime(2023, 1, 1, 10, 1, 35, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskFailed",
-                "timestamp": datetime(2023, 1, 1, 10, 1, 45, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskScheduled", # Retry
-                "timestamp": datetime(2023, 1, 1, 10, 2, 0, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskFailed",
-                "timestamp": datetime(2023, 1, 1, 10, 2, 15, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskScheduled", # Second retry
-                "timestamp": datetime(2023, 1, 1, 10, 2, 30, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskSucceeded",
-                "timestamp": datetime(2023, 1, 1, 10, 3, 0, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskStateExited",
-                "stateExitedEventDetails": {"name": "RetryState"},
-                "timestamp": datetime(2023, 1, 1, 10, 3, 5, tzinfo=timezone.utc)
-            }
-        ]
-
-    @pytest.fixture
-    def history_with_task_failure_then_exit(self):
-        """Create a history where a task fails and the next event is StateExited (no retry)."""
-        return [
-            {
-                "type": "TaskStateEntered",
-                "stateEnteredEventDetails": {"name": "FailState"},
-                "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskScheduled",
-                "timestamp": datetime(2023, 1, 1, 10, 0, 5, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskFailed",
-                "timestamp": datetime(2023, 1, 1, 10, 0, 15, tzinfo=timezone.utc)
-            },
-            {
-                "type": "TaskStateExited", # Immediate exit after failure (no retry)
-                "stateExitedEventDetails": {"name": "FailState"},
-                "timestamp": datetime(2023, 1, 1, 10, 0, 16, tzinfo=timezone.utc)
-            },
-            {
-                "type": "ExecutionSucceeded",
-                "stateExitedEventDetails": {"name": "FailState"},
-                "timestamp": datetime(2023, 1, 1, 10, 0, 20, tzinfo=timezone.utc)
-            }
-        ]
+class TestProcessExecutionHistory:
 
     def test_process_empty_history(self, sample_workflow):
         """Test processing an empty execution history."""
@@ -241,4 +260,36 @@ class TestProcessExecutionHistory:
         assert result[0].name == "FailState"
         assert result[0].start == history_with_task_failure_then_exit[0]["timestamp"]
         assert result[0].end == history_with_task_failure_then_exit[3]["timestamp"]
-        assert result[0].attempts == 1  # Should only count as 1 attempt
\ No newline at end of file
+        assert result[0].attempts == 1  # Should only count as 1 attempt
+
+    def test_nested_states_are_ordered_by_entry(self, sample_workflow):
+        """Test that a state exiting after a nested state is still emitted first, in entry order."""
+        history = [
+            {
+                "type": "ParallelStateEntered",
+                "stateEnteredEventDetails": {"name": "Outer"},
+                "timestamp": datetime(2023, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+            },
+            {
+                "type": "TaskStateEntered",
+                "stateEnteredEventDetails": {"name": "Inner"},
+                "timestamp": datetime(2023, 1, 1, 10, 0, 5, tzinfo=timezone.utc)
+            },
+            {
+                "type": "TaskStateExited",
+                "stateExitedEventDetails": {"name": "Inner"},
+                "timestamp": datetime(2023, 1, 1, 10, 0, 30, tzinfo=timezone.utc)
+            },
+            {
+                "type": "ParallelStateExited",
+                "stateExitedEventDetails": {"name": "Outer"},
+                "timestamp": datetime(2023, 1, 1, 10, 1, 0, tzinfo=timezone.utc)
+            }
+        ]
+        result = process_execution_history(sample_workflow, history)
+
+        assert [e.name for e in result] == ["Outer", "Inner"]
+        assert result[0].start == history[0]["timestamp"]
+        assert result[0].end == history[3]["timestamp"]
+        assert result[1].start == history[1]["timestamp"]
+        assert result[1].end == history[2]["timestamp"]